@@ -0,0 +1,144 @@
+"""
+A synthetic VTC corpus (see vtc_corpus) for benchmarking convert_vtc, and
+the throughput and memory of converting it.
+
+They're marked `bench`, and only run when asked for with `-m bench`. Set
+BENCH_UPDATE_BASELINE=1 to write the results out as the new baseline.
+"""
+
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+
+from vtc_corpus import corpus
+
+BENCH_DIR = pathlib.Path(__file__).parent
+BASELINE_PATH = BENCH_DIR.joinpath('baseline.json')
+SCRIPT = BENCH_DIR.parent.parent.joinpath('scripts', 'convert_vtc.py')
+
+CORPUS_FILES = int(os.environ.get('BENCH_CORPUS_FILES', 400))
+CORPUS_SEED = 0
+
+REPEATS = int(os.environ.get('BENCH_REPEATS', 3))
+
+# Throughput is only failed on when it's this many times below the baseline,
+# it's too noisy (and machine dependent) to be strict about
+THROUGHPUT_TOLERANCE = float(os.environ.get('BENCH_THROUGHPUT_TOLERANCE', 3.0))
+# memory's steadier, but depends on the python and libyaml in use
+MEMORY_TOLERANCE = float(os.environ.get('BENCH_MEMORY_TOLERANCE', 1.5))
+
+UPDATE_BASELINE = bool(os.environ.get('BENCH_UPDATE_BASELINE'))
+
+# benchmark name -> (measurement, its baseline), for the summary
+RESULTS: dict[str, tuple[dict, dict]] = {}
+
+
+class BenchCorpus:
+
+    def __init__(self, root: pathlib.Path):
+        self.source_dir = root.joinpath('vtc')
+        self.dest_dir = root.joinpath('tavern')
+        self.source_dir.mkdir()
+        self.dest_dir.mkdir()
+
+        self.texts = []
+        for name, text in corpus(CORPUS_FILES, seed=CORPUS_SEED):
+            self.source_dir.joinpath(name + '.vtc').write_text(text)
+            self.texts.append(text)
+
+        self.files = len(self.texts)
+        self.megabytes = sum(len(text.encode()) for text in self.texts) / 1e6
+
+    def throughput(self, seconds: float, peak_mb: float, texts: list[str] = None) -> dict:
+        """
+        Args:
+            * texts: the part of the corpus that took `seconds`, if not all
+              of it
+        """
+        files, megabytes = self.files, self.megabytes
+        if texts is not None:
+            files, megabytes = len(texts), sum(len(text.encode()) for text in texts) / 1e6
+
+        return {
+            'files_per_sec': round(files / seconds, 1),
+            'mb_per_sec': round(megabytes / seconds, 3),
+            'peak_mb': round(peak_mb, 2),
+        }
+
+    def run(self, *args: str) -> tuple[float, float]:
+        """
+        Convert the corpus with the script, returning its wall time and peak
+        RSS (of whichever of it and its workers peaked highest) in MB
+        """
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, str(SCRIPT), str(self.source_dir), str(self.dest_dir)] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        # wait4 rather than wait(), for the rusage; ru_maxrss covers the
+        # workers too, as it's the max over the process and its children
+        _pid, status, rusage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - start
+        output = proc.stdout.read().decode()
+        proc.stdout.close()
+
+        assert os.waitstatus_to_exitcode(status) == 0, output
+
+        # ru_maxrss is in KB on Linux
+        return seconds, rusage.ru_maxrss / 1024
+
+    def measure(self, *args: str) -> dict:
+        """
+        Run the script REPEATS times; the wall time's the median, the
+        memory the worst of any run
+        """
+        runs = [self.run(*args) for _ in range(REPEATS)]
+
+        return self.throughput(
+            statistics.median(seconds for seconds, _peak in runs),
+            max(peak for _seconds, peak in runs))
+
+
+@pytest.fixture(scope='session')
+def bench_corpus(tmp_path_factory) -> BenchCorpus:
+    return BenchCorpus(tmp_path_factory.mktemp('bench_vtc'))
+
+
+@pytest.fixture(scope='session')
+def check_baseline():
+    """
+    Record a benchmark's measurement, and fail if it's regressed from the
+    baseline
+    """
+    baseline = {}
+    if not UPDATE_BASELINE and BASELINE_PATH.exists():
+        baseline = json.loads(BASELINE_PATH.read_text())
+
+    def check(name: str, result: dict) -> None:
+        RESULTS[name] = (result, baseline.get(name, {}))
+
+        expected = baseline.get(name)
+        if expected is not None:
+            assert result['files_per_sec'] * THROUGHPUT_TOLERANCE >= expected['files_per_sec']
+            assert result['peak_mb'] <= expected['peak_mb'] * MEMORY_TOLERANCE
+
+    return check
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+
+    terminalreporter.section(f'convert_vtc benchmarks ({CORPUS_FILES} files), result (baseline)')
+    for name, (result, expected) in RESULTS.items():
+        terminalreporter.write_line(f'{name:<12} ' + '  '.join(
+            f'{metric} {value} ({expected.get(metric, "-")})' for metric, value in result.items()))
+
+    if UPDATE_BASELINE:
+        BASELINE_PATH.write_text(json.dumps(
+            {name: result for name, (result, _expected) in RESULTS.items()}, indent=2, sort_keys=True) + '\n')
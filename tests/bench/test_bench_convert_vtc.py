@@ -0,0 +1,109 @@
+"""
+Throughput and peak memory converting the synthetic corpus in conftest,
+compared with baseline.json
+"""
+
+import os
+import time
+import tracemalloc
+
+import pytest
+
+import convert_vtc
+
+pytestmark = pytest.mark.bench
+
+
+def _bench_parse(bench_corpus, parse, texts):
+    # in process, so it's the parser alone, without startup, reads or writes
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        for text in texts:
+            parse(text)
+        times.append(time.perf_counter() - start)
+
+    # separately, as tracing allocations slows everything down
+    tracemalloc.start()
+    try:
+        for text in texts:
+            parse(text)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return bench_corpus.throughput(min(times), peak / 1e6, texts)
+
+
+def test_parse(bench_corpus, check_baseline):
+    check_baseline('parse', _bench_parse(bench_corpus, convert_vtc.parse_vtc, bench_corpus.texts))
+
+
+def _regex_parses(text):
+    try:
+        convert_vtc.parse_vtc_regex(text)
+    except (AssertionError, convert_vtc.ConversionError):
+        return False
+    return True
+
+
+def test_parse_regex(bench_corpus, check_baseline):
+    # against the regex based parser parse_vtc replaced, on the files it can
+    # handle (it chokes on some comment placements and repeated expects)
+    texts = [text for text in bench_corpus.texts if _regex_parses(text)]
+
+    check_baseline('parse_regex', _bench_parse(bench_corpus, convert_vtc.parse_vtc_regex, texts))
+    check_baseline('parse_subset', _bench_parse(bench_corpus, convert_vtc.parse_vtc, texts))
+
+
+def test_convert(bench_corpus, check_baseline):
+    check_baseline('convert', bench_corpus.measure('--force'))
+
+
+def test_convert_parallel(bench_corpus, check_baseline):
+    check_baseline('convert_j0', bench_corpus.measure('--force', '--jobs', '0'))
+
+
+def test_convert_unchanged(bench_corpus, check_baseline):
+    # everything's skipped, as the manifest vouches for it. Backdated
+    # rather than waited on, so none of it's too fresh to trust.
+    bench_corpus.run()
+    backdated = time.time() - convert_vtc.RACY_SECONDS - 1
+    for path in [*bench_corpus.source_dir.iterdir(), *bench_corpus.dest_dir.iterdir()]:
+        os.utime(path, (backdated, backdated))
+    bench_corpus.run()
+    check_baseline('unchanged', bench_corpus.measure())
+
+
+def _bench_load(bench_corpus, anchors):
+    # what the test runner pays for each file, before running anything
+    import yaml
+
+    dumped = [
+        convert_vtc.dump_test_definition(convert_vtc.parse_vtc(text), anchors=anchors)
+        for text in bench_corpus.texts]
+
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        for text in dumped:
+            yaml.load(text, Loader=convert_vtc.LOADER)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        for text in dumped:
+            yaml.load(text, Loader=convert_vtc.LOADER)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return bench_corpus.throughput(min(times), peak / 1e6)
+
+
+def test_load(bench_corpus, check_baseline):
+    check_baseline('load', _bench_load(bench_corpus, anchors=False))
+
+
+def test_load_anchors(bench_corpus, check_baseline):
+    check_baseline('load_anchors', _bench_load(bench_corpus, anchors=True))
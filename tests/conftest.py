@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# the scripts aren't a package, so make them importable as top level modules
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.joinpath('scripts')))
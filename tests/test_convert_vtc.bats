@@ -38,4 +38,11 @@ teardown() {
 @test "convert all files in a dir" {
     ./convert_vtc.py "${TEMPDIR}"
     diff -q "${TEMPDIR}/${EXPECTED}" "${TEMPDIR}/${OUTFILE}"
-}
\ No newline at end of file
+}
+@test "keeps going past files it can't convert, then fails" {
+    echo "not a vtc file" > "${TEMPDIR}/bad.vtc"
+    run ./convert_vtc.py --jobs 2 "${TEMPDIR}"
+    [ "$status" -eq 1 ]
+    [[ "$output" == *"failed:"* ]]
+    [[ "$output" == *"bad.vtc: ParseError: line 1"* ]]
+}
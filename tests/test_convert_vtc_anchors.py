@@ -0,0 +1,116 @@
+"""
+--anchors output: repeated fragments written once, loading back the same
+"""
+
+import yaml
+
+import convert_vtc
+from vtc_corpus import corpus
+
+SOURCE = '''varnishtest "t"
+client c1 {
+    txreq -req GET -url /a -hdr "A: 1" -hdr "B: 2" -hdr "Host: x"
+    rxresp
+    expect resp.status == 200
+    txreq -req GET -url /b -hdr "A: 1" -hdr "B: 2" -hdr "Host: y"
+    rxresp
+    expect resp.status == 200
+    txreq -req GET -url /c -hdr "A: 1" -hdr "B: 2"
+    rxresp
+    expect resp.status == 404
+    txreq -req GET -url /c -hdr "A: 1" -hdr "B: 2"
+    rxresp
+    expect resp.status == 404
+} -run
+'''
+
+
+def _load(text):
+    return yaml.load(text, Loader=convert_vtc.LOADER)
+
+
+def test_loads_back_the_same():
+    test_definition = convert_vtc.parse_vtc(SOURCE)
+
+    plain = convert_vtc.dump_test_definition(test_definition)
+    anchored = convert_vtc.dump_test_definition(test_definition, anchors=True)
+
+    assert _load(anchored) == _load(plain)
+    assert len(anchored) < len(plain)
+
+
+def test_repeats_are_aliases():
+    anchored = convert_vtc.dump_test_definition(convert_vtc.parse_vtc(SOURCE), anchors=True)
+
+    # A and B are merged into the first two stages' headers, and are the
+    # whole of the last two's, which share their request outright
+    assert anchored.count('A: ') == 1
+    assert anchored.count('<<: ') == 2
+    assert anchored.count('/c') == 1
+    assert anchored.count('status_code') == 2
+
+
+def test_nothing_shared_is_unchanged():
+    source = 'varnishtest "t"\nclient c1 {\n    txreq -url /x -hdr "A: 1"\n    rxresp\n} -run\n'
+    test_definition = convert_vtc.parse_vtc(source)
+
+    assert (
+        convert_vtc.dump_test_definition(test_definition, anchors=True)
+        == convert_vtc.dump_test_definition(test_definition))
+
+
+def test_corpus_round_trips():
+    for _name, text in corpus(50, seed=3):
+        test_definition = convert_vtc.parse_vtc(text)
+        anchored = convert_vtc.dump_test_definition(test_definition, anchors=True)
+        assert _load(anchored) == _load(convert_vtc.dump_test_definition(test_definition))
+
+
+def test_streamed_documents_keep_their_own_anchors():
+    import io
+
+    stream = io.StringIO()
+    definitions = [convert_vtc.parse_vtc(SOURCE)] * 2
+    convert_vtc.dump_test_definitions(definitions, stream, anchors=True)
+
+    expected = _load(convert_vtc.dump_test_definition(definitions[0]))
+    assert list(yaml.load_all(stream.getvalue(), Loader=convert_vtc.LOADER)) == [expected, expected]
+
+
+def test_round_trip_failures_are_per_definition(monkeypatch):
+    import io
+
+    other = SOURCE.replace('"A: 1"', '"A: 3"')
+    deduplicate = convert_vtc.deduplicate
+
+    def broken_for_other(test_definition):
+        deduplicated = deduplicate(test_definition)
+        if test_definition['stages'][0].request.headers['A'] == '3':
+            return dict(deduplicated, test_name='changed')
+        return deduplicated
+
+    monkeypatch.setattr(convert_vtc, 'deduplicate', broken_for_other)
+
+    stream = io.StringIO()
+    converted, failures = convert_vtc.stream_all([SOURCE, other, SOURCE], stream, anchors=True)
+
+    assert converted == 2
+    assert list(failures) == [other]
+    assert 'load back the same' in failures[other]
+    assert len(list(yaml.load_all(stream.getvalue(), Loader=convert_vtc.LOADER))) == 2
+
+
+def test_manifest_tells_anchored_output_apart(tmp_path, monkeypatch):
+    monkeypatch.setattr(convert_vtc, 'RACY_SECONDS', 0)
+    source = tmp_path.joinpath('t.vtc')
+    source.write_text(SOURCE)
+    pairs = [(source, tmp_path.joinpath('t.tavern.yaml'))]
+
+    def sync(options):
+        return convert_vtc.convert_changed(
+            pairs, convert_vtc.Manifest(tmp_path, options=options), anchors=bool(options))[:2]
+
+    assert sync(None) == (1, 0)
+    assert sync({'anchors': True}) == (1, 0)
+    assert sync({'anchors': True}) == (0, 1)
+    assert '<<: ' in pairs[0][1].read_text()
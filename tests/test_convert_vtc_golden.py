@@ -0,0 +1,60 @@
+"""
+Converted output of synthetic files covering what the corpus generator
+varies, against golden copies in convert_vtc/golden/.
+
+Set GOLDEN_UPDATE=1 to regenerate them (inputs included), then review the
+diff.
+"""
+
+import os
+import pathlib
+
+import pytest
+import yaml
+
+import convert_vtc
+from vtc_corpus import synthetic_vtc
+
+GOLDEN_DIR = pathlib.Path(__file__).parent.joinpath('convert_vtc', 'golden')
+
+UPDATE_GOLDEN = bool(os.environ.get('GOLDEN_UPDATE'))
+
+GOLDEN_CASES = {
+    'minimal': dict(clients=1, headers=0, comments='none'),
+    'above_comments': dict(clients=3, headers=2, comments='above', seed=1),
+    'below_comments': dict(clients=3, headers=2, comments='below', seed=2),
+    'one_line_headers': dict(clients=2, headers=5, continued=False, seed=3),
+    'many_headers': dict(clients=1, headers=40, seed=4),
+    'many_clients': dict(clients=25, headers=3, seed=5),
+    'several_cases': dict(clients=2, headers=2, cases=3, seed=6),
+    'padded': dict(clients=2, headers=2, padding=8192, seed=7),
+}
+
+
+def _convert(text):
+    return yaml.dump(convert_vtc.parse_vtc(text), Dumper=convert_vtc.DUMPER, sort_keys=False)
+
+
+@pytest.mark.parametrize('name', list(GOLDEN_CASES))
+def test_golden(name):
+    source_path = GOLDEN_DIR.joinpath(name + convert_vtc.VTC_EXT)
+    golden_path = GOLDEN_DIR.joinpath(name + convert_vtc.TAVERN_EXT)
+
+    if UPDATE_GOLDEN:
+        GOLDEN_DIR.mkdir(exist_ok=True)
+        source_path.write_text(synthetic_vtc(**GOLDEN_CASES[name]))
+        golden_path.write_text(_convert(source_path.read_text()))
+
+    assert _convert(source_path.read_text()) == golden_path.read_text()
+
+
+def test_golden_through_the_cli(tmp_path):
+    # the same again, but the way they'd really be converted
+    converted, failures = convert_vtc.convert_all([
+        (GOLDEN_DIR.joinpath(name + convert_vtc.VTC_EXT), tmp_path.joinpath(name + convert_vtc.TAVERN_EXT))
+        for name in GOLDEN_CASES], jobs=2)
+
+    assert (converted, failures) == (len(GOLDEN_CASES), {})
+    for name in GOLDEN_CASES:
+        golden = GOLDEN_DIR.joinpath(name + convert_vtc.TAVERN_EXT).read_text()
+        assert tmp_path.joinpath(name + convert_vtc.TAVERN_EXT).read_text() == golden
@@ -0,0 +1,160 @@
+"""
+Incremental conversion, against the manifest kept in the dest dir
+"""
+
+import os
+import pathlib
+
+import pytest
+
+import convert_vtc
+
+FIXTURE = pathlib.Path(__file__).parent.joinpath('convert_vtc', 'test_cfg.vtc')
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    # everything's just been written, which would otherwise always be hashed
+    monkeypatch.setattr(convert_vtc, 'RACY_SECONDS', 0)
+
+    source_dir = tmp_path.joinpath('vtc')
+    dest_dir = tmp_path.joinpath('tavern')
+    source_dir.mkdir()
+    dest_dir.mkdir()
+    for name in ['one', 'two', 'three']:
+        source_dir.joinpath(name + convert_vtc.VTC_EXT).write_text(FIXTURE.read_text())
+
+    return source_dir, dest_dir
+
+
+def _sync(source_dir, dest_dir, prune=False):
+    pairs = [
+        (source, dest_dir.joinpath(source.stem).with_suffix(convert_vtc.TAVERN_EXT))
+        for source in sorted(source_dir.glob('*' + convert_vtc.VTC_EXT))]
+    converted, skipped, failures, pruned = convert_vtc.convert_changed(
+        pairs, convert_vtc.Manifest(dest_dir), prune=prune)
+    assert not failures
+
+    return converted, skipped, pruned
+
+
+def test_unchanged_files_are_skipped(dirs):
+    assert _sync(*dirs) == (3, 0, [])
+    assert _sync(*dirs) == (0, 3, [])
+
+
+def test_changed_sources_are_converted(dirs):
+    source_dir, dest_dir = dirs
+    _sync(*dirs)
+
+    source = source_dir.joinpath('two.vtc')
+    source.write_text(source.read_text().replace('basic auth test', 'a changed auth test'))
+
+    assert _sync(*dirs) == (1, 2, [])
+    assert 'a changed auth test' in dest_dir.joinpath('two.tavern.yaml').read_text()
+
+
+def test_touched_but_unchanged_files_are_skipped(dirs):
+    source_dir, _dest_dir = dirs
+    _sync(*dirs)
+
+    os.utime(source_dir.joinpath('one.vtc'), ns=(1, 1))
+
+    assert _sync(*dirs) == (0, 3, [])
+
+
+def test_edited_or_deleted_output_is_converted_again(dirs):
+    _source_dir, dest_dir = dirs
+    _sync(*dirs)
+
+    dest_dir.joinpath('one.tavern.yaml').write_text('edited')
+    dest_dir.joinpath('two.tavern.yaml').unlink()
+
+    assert _sync(*dirs) == (2, 1, [])
+    assert dest_dir.joinpath('one.tavern.yaml').read_text() != 'edited'
+
+
+def test_new_converter_version_converts_everything(dirs, monkeypatch):
+    _sync(*dirs)
+    monkeypatch.setattr(convert_vtc, 'CONVERTER_VERSION', convert_vtc.CONVERTER_VERSION + 1)
+
+    assert _sync(*dirs) == (3, 0, [])
+
+
+def test_prune(dirs):
+    source_dir, dest_dir = dirs
+    _sync(*dirs)
+
+    source_dir.joinpath('three.vtc').unlink()
+
+    assert _sync(*dirs) == (0, 2, [])
+    assert dest_dir.joinpath('three.tavern.yaml').exists()
+
+    assert _sync(*dirs, prune=True) == (0, 2, [dest_dir.joinpath('three.tavern.yaml')])
+    assert not dest_dir.joinpath('three.tavern.yaml').exists()
+    assert _sync(*dirs, prune=True) == (0, 2, [])
+
+
+@pytest.mark.parametrize('extra_args, manifest', [([], False), (['--prune'], True)], ids=['plain', 'prune'])
+def test_single_file_manifest(dirs, monkeypatch, extra_args, manifest):
+    source_dir, dest_dir = dirs
+    source = source_dir.joinpath('one' + convert_vtc.VTC_EXT)
+    monkeypatch.setattr('sys.argv', ['convert_vtc', str(source), str(dest_dir)] + extra_args)
+
+    convert_vtc.main()
+
+    assert dest_dir.joinpath('one' + convert_vtc.TAVERN_EXT).exists()
+    assert dest_dir.joinpath(convert_vtc.MANIFEST_NAME).exists() == manifest
+
+
+def test_watch(dirs, monkeypatch):
+    source_dir, dest_dir = dirs
+    bad = source_dir.joinpath('bad' + convert_vtc.VTC_EXT)
+    bad.write_text('not a varnishtest\n')
+
+    converting = []
+    convert_one = convert_vtc._convert_one
+
+    def recording(paths, **kwargs):
+        converting.append(paths[0].stem)
+        return convert_one(paths, **kwargs)
+
+    monkeypatch.setattr(convert_vtc, '_convert_one', recording)
+
+    # between one pass and the next
+    def edit_two():
+        source_dir.joinpath('two' + convert_vtc.VTC_EXT).write_text(FIXTURE.read_text() + '# edited\n')
+
+    def remove_three_touch_bad():
+        source_dir.joinpath('three' + convert_vtc.VTC_EXT).unlink()
+        os.utime(bad, ns=(bad.stat().st_atime_ns, bad.stat().st_mtime_ns + 1_000_000_000))
+
+    def stop():
+        raise KeyboardInterrupt
+
+    between = iter([edit_two, remove_three_touch_bad, stop])
+    # what each pass converted
+    passes = []
+
+    def sleep(_seconds):
+        passes.append(sorted(converting))
+        converting.clear()
+        next(between)()
+
+    monkeypatch.setattr(convert_vtc.time, 'sleep', sleep)
+
+    def collect():
+        return [
+            (source, dest_dir.joinpath(source.stem).with_suffix(convert_vtc.TAVERN_EXT))
+            for source in source_dir.glob('*' + convert_vtc.VTC_EXT)]
+
+    convert_vtc._watch(collect, convert_vtc.Manifest(dest_dir), prune=True)
+
+    assert passes == [
+        ['bad', 'one', 'three', 'two'],
+        # bad's not retried until it changes
+        ['two'],
+        ['bad'],
+    ]
+    assert not dest_dir.joinpath('three' + convert_vtc.TAVERN_EXT).exists()
+    assert dest_dir.joinpath('one' + convert_vtc.TAVERN_EXT).exists()
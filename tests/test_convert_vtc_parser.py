@@ -0,0 +1,134 @@
+"""
+parse_vtc, against the regex based parse_vtc_regex it replaced
+"""
+
+import pathlib
+import time
+
+import pytest
+
+import convert_vtc
+from vtc_corpus import synthetic_vtc
+
+FIXTURE = pathlib.Path(__file__).parent.joinpath('convert_vtc', 'test_cfg.vtc')
+
+
+def _best_of(repeats, func, *args):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        try:
+            func(*args)
+        except convert_vtc.ConversionError:
+            pass
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def test_fixture_matches_regex_path():
+    source = FIXTURE.read_text()
+
+    assert convert_vtc.parse_vtc(source) == convert_vtc.parse_vtc_regex(source)
+
+
+def test_above_comment_names_stage():
+    source = 'varnishtest "t"\n# above\nclient c1 {\n    txreq -url /x\n    rxresp\n} -run\n'
+
+    (stage,) = convert_vtc.parse_vtc(source)['stages']
+    assert stage.name == 'above'
+    assert stage.request.method == 'GET'
+
+
+def test_every_case_in_a_client():
+    source = (
+        'varnishtest "t"\n'
+        'client c1 {\n'
+        '    txreq -req POST -url /one\n'
+        '    rxresp\n'
+        '    expect resp.status == 201\n'
+        '    txreq -req GET -url /two -hdr "A: b"\n'
+        '    rxresp\n'
+        '    expect resp.body == "ok"\n'
+        '} -run\n')
+
+    first, second = convert_vtc.parse_vtc(source)['stages']
+    assert (first.name, first.request.method, first.response) == ('t-c1', 'POST', {'status_code': 201})
+    assert (second.name, second.request.headers, second.response) == (
+        't-c1-1', {'A': 'b'}, {'json': {'body': 'ok'}})
+
+
+@pytest.mark.parametrize('source, line, message', [
+    ('client c1 {\n}\n', 1, 'varnishtest'),
+    ('varnishtest "t"\n\nclient c1 {\n    txreq -url /x\n} -run\n', 3, 'without an rxresp'),
+    ('varnishtest "t"\nclient c1 {\n    txreq -url /x\n    rxresp\n    delay 1\n} -run\n', 5, '`delay`'),
+    ('varnishtest "t"\nclient c1 {\n    txreq -url /x -hdr "oops\n', 3, 'unterminated'),
+    ('varnishtest "t"\n# above\nclient c1 {\n    # below\n    txreq\n    rxresp\n}\n', 3, 'both above and below'),
+])
+def test_errors_have_line_numbers(source, line, message):
+    with pytest.raises(convert_vtc.ParseError) as exc_info:
+        convert_vtc.parse_vtc(source)
+
+    assert exc_info.value.line == line
+    assert message in str(exc_info.value)
+
+
+def test_matches_regex_path_on_large_corpus():
+    corpus = [synthetic_vtc(clients=20, headers=12, seed=seed) for seed in range(20)]
+
+    for source in corpus:
+        assert convert_vtc.parse_vtc(source) == convert_vtc.parse_vtc_regex(source)
+
+
+def test_long_strings_are_skipped():
+    source = (
+        'varnishtest "t"\n'
+        'server s1 {\n'
+        '    rxreq\n'
+        '    txresp -body {"{"key": "value" }\n  "quoted" }"}\n'
+        '} -start\n'
+        'client c1 {\n'
+        '    txreq -url /x\n'
+        '    rxresp\n'
+        '} -run\n')
+
+    (stage,) = convert_vtc.parse_vtc(source)['stages']
+    assert stage.request.url.endswith('/x')
+
+
+def test_unterminated_long_string_fails_where_it_starts():
+    source = 'varnishtest "t"\nserver s1 {\n' + '    txresp -body {"oops\n' * 5000
+
+    with pytest.raises(convert_vtc.ParseError) as exc_info:
+        convert_vtc.parse_vtc(source)
+
+    assert exc_info.value.line == 3
+    assert 'unterminated long string' in str(exc_info.value)
+
+
+def _long_strings_vtc(clients):
+    # a server full of `{"` bodies with quotes in them, which is what a long
+    # string's scan has to step over
+    body = '    txresp -body {"' + '{"a": "b" } ' * 20 + '"}'
+    return synthetic_vtc(clients=clients, headers=4).replace(
+        '    txresp\n', '\n'.join([body] * clients) + '\n', 1)
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize('make_source', [
+    lambda clients: synthetic_vtc(clients=clients, headers=30),
+    lambda clients: synthetic_vtc(clients=clients, headers=30, malformed=True),
+    _long_strings_vtc,
+    lambda clients: 'varnishtest "t"\nclient c1 {\n    txreq -hdr' + ' ' * 100 * clients + '"oops\n',
+], ids=['well_formed', 'malformed', 'long_strings', 'whitespace_then_unterminated'])
+def test_linear_time(make_source):
+    # the regex path is exponential in the headers of a malformed client,
+    # and would take hours on the larger of these
+    small = make_source(50)
+    large = make_source(400)
+
+    small_seconds = _best_of(3, convert_vtc.parse_vtc, small)
+    large_seconds = _best_of(3, convert_vtc.parse_vtc, large)
+
+    # 8x the input; quadratic would be 64x. Plenty of slack for noise.
+    assert large_seconds < small_seconds * 8 * 3
@@ -0,0 +1,78 @@
+"""
+iter_test_definitions and the multi-document output built on it
+"""
+
+import io
+import pathlib
+
+import pytest
+import yaml
+
+import convert_vtc
+
+FIXTURE = pathlib.Path(__file__).parent.joinpath('convert_vtc', 'test_cfg.vtc')
+
+BROKEN = 'not a varnishtest\n'
+
+
+def test_yields_a_definition_per_source():
+    sources = [FIXTURE, FIXTURE.read_text()]
+    definitions = list(convert_vtc.iter_test_definitions(sources))
+
+    assert len(definitions) == 2
+    assert definitions[0] == definitions[1] == convert_vtc.parse_vtc(FIXTURE.read_text())
+
+
+def test_is_lazy():
+    def sources():
+        yield FIXTURE
+        raise AssertionError('read past the first source')
+
+    definitions = convert_vtc.iter_test_definitions(sources())
+    assert next(definitions)['test_name']
+
+
+def test_errors_raise_without_on_error():
+    with pytest.raises(convert_vtc.ParseError):
+        list(convert_vtc.iter_test_definitions([BROKEN]))
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_on_error_skips(jobs):
+    failed = []
+    definitions = list(convert_vtc.iter_test_definitions(
+        [FIXTURE, BROKEN, FIXTURE], jobs=jobs, on_error=lambda source, exc: failed.append((source, exc))))
+
+    assert len(definitions) == 2
+    assert [source for source, _exc in failed] == [BROKEN]
+    assert isinstance(failed[0][1], convert_vtc.ParseError)
+    assert failed[0][1].line == 1
+
+
+def test_multi_document_round_trip():
+    stream = io.StringIO()
+    converted, failures = convert_vtc.stream_all([FIXTURE, BROKEN, FIXTURE], stream)
+
+    assert converted == 2
+    assert list(failures) == [BROKEN]
+
+    expected = yaml.safe_load(yaml.safe_dump(convert_vtc.parse_vtc(FIXTURE.read_text()), sort_keys=False))
+    assert list(yaml.safe_load_all(stream.getvalue())) == [expected, expected]
+
+
+def test_fail_fast_stops_at_the_first_failure():
+    stream = io.StringIO()
+    converted, failures = convert_vtc.stream_all([FIXTURE, BROKEN, FIXTURE], stream, fail_fast=True)
+
+    assert converted == 1
+    assert list(failures) == [BROKEN]
+    assert len(list(yaml.safe_load_all(stream.getvalue()))) == 1
+
+
+def test_fail_fast_leaves_write_errors_alone():
+    class Unwritable(io.StringIO):
+        def write(self, text):
+            raise BrokenPipeError
+
+    with pytest.raises(BrokenPipeError):
+        convert_vtc.stream_all([FIXTURE], Unwritable(), fail_fast=True)
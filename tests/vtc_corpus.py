@@ -0,0 +1,101 @@
+"""
+Synthetic VTC files, for the converter's golden tests and benchmarks.
+
+Everything's seeded, so the same arguments always make the same file.
+"""
+
+import random
+
+COMMENT_PLACEMENTS = ('none', 'above', 'below')
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE')
+
+LOTSA_ZEROS = '0' * 24
+
+# headers with the values convert_vtc treats specially
+SPECIAL_HEADERS = [
+    f'X-IXSource-SourceID: {LOTSA_ZEROS}',
+    f'X-IXSource-AccountID: {LOTSA_ZEROS}',
+    'X-IXSource-WF-Prefix-JSON: {\\"path\\": \\"\\", \\"host\\": \\"example.com\\", \\"scheme\\": \\"http\\"}',
+]
+
+
+def _header(rng, client, header):
+    if rng.random() < 0.1:
+        return rng.choice(SPECIAL_HEADERS)
+
+    return f'X-IXSource-Header-{header}: value-{client}-{header}'
+
+
+def synthetic_vtc(
+        clients=1, headers=4, continued=True, comments='above', cases=1, padding=0, malformed=False, seed=0):
+    """
+    A file of `clients` clients, each sending `cases` requests.
+
+    Args:
+        * headers (int): how many headers each request has (plus Host)
+        * continued (bool): one header per `\\`-continued line, rather than
+          all on the txreq line
+        * comments (str): where each client's comment goes, one of
+          COMMENT_PLACEMENTS. It names the test stage.
+        * padding (int): roughly how many bytes of comments to add to the
+          server block, which makes the file bigger without changing what
+          it converts to
+        * malformed (bool): if so, the last client never `rxresp`s
+        * seed (int): for the choice of methods, paths and headers
+    """
+    rng = random.Random(seed)
+
+    lines = ['varnishtest "synthetic"', '', 'server s1 {', '    rxreq']
+    while padding > 0:
+        filler = f'    # {"filler " * rng.randint(1, 12)}'
+        lines.append(filler)
+        padding -= len(filler) + 1
+    lines.extend(['    txresp', '} -start', ''])
+
+    for client in range(clients):
+        if comments == 'above':
+            lines.append(f'# client number {client}')
+        lines.append(f'client c{client} {{')
+        if comments == 'below':
+            lines.append(f'    # client number {client}')
+
+        for case in range(cases):
+            hdrs = [f'-hdr "{_header(rng, client, header)}"' for header in range(headers)]
+            hdrs.append('-hdr "Host: example.com"')
+            method = rng.choice(METHODS)
+            txreq = f'    txreq -req "{method}" -url "/path/{client}/{case}/image.jpg"'
+            if continued:
+                lines.append(txreq + ' \\')
+                lines.extend(f'        {hdr} \\' for hdr in hdrs[:-1])
+                lines.append(f'        {hdrs[-1]}')
+            else:
+                lines.append(' '.join([txreq] + hdrs))
+
+            if not (malformed and client == clients - 1 and case == cases - 1):
+                lines.append('    rxresp')
+            lines.append(f'    expect resp.status == {rng.choice([200, 204, 301, 404])}')
+            if rng.random() < 0.3:
+                lines.append('    expect resp.body == "ok"')
+
+        lines.append('} -run')
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
+def corpus(count, seed=0, max_clients=12, max_headers=16, max_padding=4096):
+    """
+    Yield (name, VTC text) for `count` files, varying everything
+    synthetic_vtc can. Every file converts.
+    """
+    rng = random.Random(seed)
+
+    for index in range(count):
+        yield f'synthetic_{index:05d}', synthetic_vtc(
+            clients=rng.randint(1, max_clients),
+            headers=rng.randint(0, max_headers),
+            continued=rng.random() < 0.8,
+            comments=rng.choice(COMMENT_PLACEMENTS),
+            cases=1 if rng.random() < 0.7 else rng.randint(2, 4),
+            padding=rng.choice([0, 0, rng.randint(0, max_padding)]),
+            seed=rng.getrandbits(32))
@@ -3,26 +3,85 @@ TBH I forget why I started writing a caching module in this package. mostly
 just playing at this point I guess?
 """
 
+import atexit
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from enum import Enum
+import fcntl
+import functools
+import os
 from pathlib import Path
 import pickle
-from tempfile import TemporaryFile
-from typing import Any, Optional
+from tempfile import NamedTemporaryFile, TemporaryFile
+import threading
+import time
+from typing import Any, Callable, Hashable, NamedTuple, Optional, Union
+
+from theme_switcher import trace
 
 # make `Path` a class
 Path = Path('.').__class__
 
 NO_DEFAULT = object()
 
+SQLITE_MEMORY = ':memory:'
+SQLITE_SUFFIX = '.sqlite'
+MIGRATED_SUFFIX = '.migrated'
+LOCK_SUFFIX = '.lock'
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+# Internal sentinels for MemoryFront
+_MISSING = object()
+_DELETED = object()
+
+MEMOIZE_KEY_PREFIX = 'memoize'
+
+# Set by `set_refresh`, makes memoized functions ignore what's cached
+_refresh = False
+
+
+class Expiring(NamedTuple):
+    """
+    How a value stored with a TTL is persisted, `expires` being a timestamp
+    """
+    value: Any
+    expires: float
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.expires <= (time.time() if now is None else now)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    write_backs: int = 0
+
 
 class RunScopeMixin:
 
+    # Whether single key reads/writes are cheap, rather than going through the
+    # whole cache
+    per_key = False
+
     def _read_cache(self):
         raise NotImplementedError()
 
     def _write_cache(self):
         raise NotImplementedError()
 
+    @contextmanager
+    def batch(self):
+        """
+        Group several stores, for backends where that saves anything
+        """
+        yield self
+
     def store(self, key, value, overwrite=True) -> bool:
 
         cache = self._read_cache()
@@ -35,6 +94,8 @@ class RunScopeMixin:
         cache[key] = value
         self._write_cache(cache)
 
+        return True
+
     def retrieve(self, key: str, default: Optional[Any] = NO_DEFAULT):
         cache = self._read_cache()
         value = cache.get(key, default)
@@ -44,6 +105,16 @@ class RunScopeMixin:
 
         return value
 
+    def delete(self, key: str) -> bool:
+        cache = self._read_cache()
+        if key not in cache:
+            return False
+
+        del cache[key]
+        self._write_cache(cache)
+
+        return True
+
 
 class RunScopeTemp(RunScopeMixin):
     """
@@ -67,17 +138,414 @@ class RunScopeTemp(RunScopeMixin):
         self.file.write(pickle.dumps(cache))
 
 
+# RunScopeFile path -> lock serialising batches between threads. flock only
+# serialises between processes.
+_thread_locks: dict[str, threading.RLock] = {}
+_thread_locks_lock = threading.Lock()
+
+
 class RunScopeFile(Path, RunScopeMixin):
+    """
+    Every read-modify-write happens in a `batch`, under an advisory lock on a
+    sidecar LOCK_SUFFIX file, and is written out with an atomic rename. The
+    GLOBAL scope is shared between users, and two switches can easily race.
+    """
 
-    def _read_cache(self) -> str:
+    def _thread_lock(self) -> threading.RLock:
+        with _thread_locks_lock:
+            return _thread_locks.setdefault(str(self), threading.RLock())
+
+    @contextmanager
+    def batch(self):
+        """
+        Take the lock, read the cache once, and write it once (if anything
+        changed) at the end. Nested batches join the outer one.
+        """
+        with self._thread_lock():
+            if getattr(self, '_batched', None) is not None:
+                yield self
+                return
+
+            self.parent.mkdir(parents=True, exist_ok=True)
+            with self.with_suffix(LOCK_SUFFIX).open('a') as lock_fh:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+
+                self._batched = self._read_file()
+                self._batch_dirty = False
+                try:
+                    yield self
+                    if self._batch_dirty:
+                        self._replace_file(self._batched)
+                finally:
+                    self._batched = None
+                    # closing lock_fh releases the flock
+
+    def _read_file(self) -> dict:
         try:
             cache = self.read_bytes()
         except FileNotFoundError:
             return {}
+        if not cache:
+            return {}
         return pickle.loads(cache)
 
-    def _write_cache(self, cache: str) -> None:
-        self.write_bytes(pickle.dumps(cache))
+    def _replace_file(self, cache: dict) -> None:
+        try:
+            mode = self.stat().st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+
+        with NamedTemporaryFile(
+                'wb', dir=self.parent, prefix=f'.{self.name}.', delete=False) as tmp_fh:
+            try:
+                tmp_fh.write(pickle.dumps(cache))
+                tmp_fh.flush()
+                os.fsync(tmp_fh.fileno())
+                os.chmod(tmp_fh.name, mode)
+            except BaseException:
+                os.unlink(tmp_fh.name)
+                raise
+
+        os.replace(tmp_fh.name, self)
+
+    def _read_cache(self) -> dict:
+        batched = getattr(self, '_batched', None)
+        if batched is not None:
+            return batched
+        return self._read_file()
+
+    def _write_cache(self, cache: dict) -> None:
+        with self.batch():
+            self._batched = cache
+            self._batch_dirty = True
+
+    def store(self, key, value, overwrite=True) -> bool:
+        # so the read and the write happen under the same lock
+        with self.batch():
+            return super().store(key, value, overwrite=overwrite)
+
+    def delete(self, key: str) -> bool:
+        with self.batch():
+            return super().delete(key)
+
+
+class RunScopeSqlite(RunScopeMixin):
+    """
+    One row per key, so `store` and `retrieve` only read or write the key
+    they're given rather than the whole cache.
+    """
+
+    per_key = True
+
+    def __init__(self, path: Union[str, Path] = SQLITE_MEMORY):
+        self.path = path
+        self._connection = None
+        self._lock = threading.RLock()
+
+    def _connect(self) -> 'sqlite3.Connection':
+        # connect (and import sqlite3) lazily, so merely importing this module
+        # never touches disk
+        if self._connection is None:
+            import sqlite3
+            if self.path != SQLITE_MEMORY:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            # autocommit; transactions are managed by `_transaction`, and
+            # cross thread use is serialised by self._lock
+            self._connection = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+
+        return self._connection
+
+    @contextmanager
+    def _transaction(self):
+        """
+        IMMEDIATE, so nobody can sneak a write in between our reads and
+        writes. Joins the current transaction if there is one.
+        """
+        with self._lock:
+            connection = self._connect()
+            if connection.in_transaction:
+                yield connection
+                return
+
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    @contextmanager
+    def batch(self):
+        with self._transaction():
+            yield self
+
+    def _read_cache(self) -> dict:
+        with self._transaction() as connection:
+            rows = connection.execute('SELECT key, value FROM cache').fetchall()
+        return {key: pickle.loads(value) for key, value in rows}
+
+    def _write_cache(self, cache: dict) -> None:
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM cache')
+            connection.executemany(
+                'INSERT INTO cache (key, value) VALUES (?, ?)',
+                ((key, pickle.dumps(value)) for key, value in cache.items()))
+
+    def store(self, key, value, overwrite=True) -> bool:
+        with self._transaction() as connection:
+            row = connection.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                if pickle.loads(row[0]) == value:
+                    return False
+                elif not overwrite:
+                    raise NotOverwriting()
+
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)',
+                (key, pickle.dumps(value)))
+
+        return True
+
+    def retrieve(self, key: str, default: Optional[Any] = NO_DEFAULT):
+        with self._lock:
+            row = self._connect().execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+
+        if row is not None:
+            return pickle.loads(row[0])
+        elif default is NO_DEFAULT:
+            raise KeyError(f'No object in cache at {key}')
+
+        return default
+
+    def delete(self, key: str) -> bool:
+        with self._transaction() as connection:
+            return bool(connection.execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount)
+
+    def migrate_from(self, old: RunScopeMixin) -> int:
+        """
+        Copy everything cached in `old` into this cache, without clobbering
+        anything already here. Returns how many entries were copied.
+        """
+        old_cache = old._read_cache()
+
+        with self._transaction() as connection:
+            return connection.executemany(
+                'INSERT OR IGNORE INTO cache (key, value) VALUES (?, ?)',
+                ((key, pickle.dumps(value)) for key, value in old_cache.items())).rowcount
+
+
+class MemoryFront(RunScopeMixin):
+    """
+    Bounded, in-process LRU in front of another backend.
+
+    Reads are served from memory once a key has been seen. Stores only go to
+    memory, and are written back to `backend` together on `flush()`, which
+    happens at exit at the latest. Values stored with a TTL are persisted as
+    `Expiring`, and dropped from the backend once they've expired.
+    """
+
+    def __init__(
+            self, backend: RunScopeMixin,
+            max_entries: int = DEFAULT_MAX_ENTRIES,
+            max_bytes: int = DEFAULT_MAX_BYTES):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+
+        # key -> (value, expiry or None, pickled size); least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # key -> what to write back to the backend, _DELETED to remove it.
+        # Kept apart from _entries so evicting never loses a write.
+        self._pending = {}
+        self._lock = threading.RLock()
+
+    def _remember(self, key: str, value: Any, expires: Optional[float]) -> None:
+        self._forget(key)
+
+        size = len(pickle.dumps(value))
+        self._entries[key] = (value, expires, size)
+        self._bytes += size
+
+        while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _key, (_value, _expires, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.stats.evictions += 1
+
+    def _forget(self, key: str) -> None:
+        try:
+            _value, _expires, size = self._entries.pop(key)
+        except KeyError:
+            return
+        self._bytes -= size
+
+    def _get(self, key: str, count: bool = True) -> Any:
+        now = time.time()
+
+        try:
+            value, expires, _size = self._entries[key]
+        except KeyError:
+            pass
+        else:
+            if expires is None or expires > now:
+                self._entries.move_to_end(key)
+                if count:
+                    self.stats.hits += 1
+                return value
+
+            self._forget(key)
+            self._pending[key] = _DELETED
+            self.stats.expirations += 1
+
+        if count:
+            self.stats.misses += 1
+
+        stored = self._pending.get(key, _MISSING)
+        if stored is _MISSING:
+            stored = self.backend.retrieve(key, default=_MISSING)
+
+        if stored is _MISSING or stored is _DELETED:
+            return _MISSING
+
+        if isinstance(stored, Expiring):
+            if stored.expired(now):
+                self._pending[key] = _DELETED
+                self.stats.expirations += 1
+                return _MISSING
+            self._remember(key, stored.value, stored.expires)
+            return stored.value
+
+        self._remember(key, stored, None)
+        return stored
+
+    def _read_cache(self) -> dict:
+        with self._lock:
+            self.flush()
+            stored = self.backend._read_cache()
+
+        now = time.time()
+        cache = {}
+        for key, value in stored.items():
+            if isinstance(value, Expiring):
+                if value.expired(now):
+                    continue
+                value = value.value
+            cache[key] = value
+
+        return cache
+
+    def _write_cache(self, cache: dict) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._pending.clear()
+            self.backend._write_cache(cache)
+
+    def store(self, key, value, overwrite=True, ttl: Optional[float] = None) -> bool:
+        """
+        Args:
+            * ttl: seconds until the value expires, never if None
+        """
+        with self._lock:
+            expires = None if ttl is None else time.time() + ttl
+            current = self._get(key, count=False)
+            if current is not _MISSING:
+                # a new ttl is a change too, even for the same value
+                _value, current_expires, _size = self._entries.get(key, (None, None, 0))
+                if current == value and current_expires == expires:
+                    return False
+                elif not overwrite:
+                    raise NotOverwriting()
+
+            self._remember(key, value, expires)
+            self._pending[key] = value if expires is None else Expiring(value, expires)
+
+            if len(self._pending) > self.max_entries:
+                self.flush()
+
+        return True
+
+    def retrieve(self, key: str, default: Optional[Any] = NO_DEFAULT):
+        with self._lock:
+            value = self._get(key)
+
+        if value is not _MISSING:
+            return value
+        elif default is NO_DEFAULT:
+            raise KeyError(f'No object in cache at {key}')
+
+        return default
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            existed = self._get(key, count=False) is not _MISSING
+            self._forget(key)
+            self._pending[key] = _DELETED
+
+        return existed
+
+    @contextmanager
+    def batch(self):
+        """
+        Stores are already held until `flush`, so this just flushes at the end
+        """
+        with self._lock:
+            yield self
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write everything stored since the last flush back to the backend, in
+        one backend batch
+        """
+        with self._lock, trace.span(
+                'cache.flush', backend=type(self.backend).__name__, keys=len(self._pending)):
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        try:
+            with self.backend.batch():
+                if self.backend.per_key:
+                    for key, value in pending.items():
+                        if value is _DELETED:
+                            self.backend.delete(key)
+                        else:
+                            self.backend.store(key, value)
+                else:
+                    # one read and one write, however many keys changed. Also the
+                    # chance to drop anything that's expired.
+                    now = time.time()
+                    cache = self.backend._read_cache()
+                    for key, value in pending.items():
+                        if value is _DELETED:
+                            cache.pop(key, None)
+                        else:
+                            cache[key] = value
+
+                    expired = [
+                        key for key, value in cache.items()
+                        if isinstance(value, Expiring) and value.expired(now)]
+                    for key in expired:
+                        del cache[key]
+                    self.stats.expirations += len(expired)
+
+                    self.backend._write_cache(cache)
+        except BaseException:
+            # don't lose the writes, anything stored since takes precedence
+            self._pending = {**pending, **self._pending}
+            raise
+
+        self.stats.write_backs += len(pending)
 
 
 class Scope(Enum):
@@ -85,19 +553,197 @@ class Scope(Enum):
     USER = RunScopeFile.home().joinpath('.cache', 'theme_switcher')
     RUN = RunScopeTemp()
 
+    @property
+    def backend(self) -> RunScopeMixin:
+        """
+        What this scope actually stores to: `value` (or whatever was picked
+        with `select_backend`), behind a MemoryFront by default
+        """
+        try:
+            return _selected_backends[self]
+        except KeyError:
+            return select_backend(self, self.value, migrate=False)
+
+    def batch(self):
+        """
+        `with scope.batch(): ...` to write any number of stores out in one go
+        """
+        return self.backend.batch()
+
+
+# Scope -> backend overriding its default (pickle) storage
+_selected_backends: dict[Scope, RunScopeMixin] = {}
+
+
+def _sqlite_backend(scope: Scope) -> RunScopeSqlite:
+    if isinstance(scope.value, RunScopeFile):
+        return RunScopeSqlite(scope.value.with_suffix(SQLITE_SUFFIX))
+    return RunScopeSqlite(SQLITE_MEMORY)
+
+
+BACKEND_TYPES = {
+    'pickle': lambda scope: scope.value,
+    'sqlite': _sqlite_backend,
+}
+
+
+def select_backend(
+        scope: Scope, backend: Union[str, RunScopeMixin],
+        migrate: bool = True, front: bool = True) -> RunScopeMixin:
+    """
+    Make `scope` store to `backend` from here on.
+
+    Args:
+        * scope
+        * backend: either a RunScopeMixin, or a name from BACKEND_TYPES
+        * migrate: copy the scope's existing pickle cache into the new backend
+            (when it supports `migrate_from`). The pickle file is then renamed
+            with MIGRATED_SUFFIX so it's only migrated the once.
+        * front: put a MemoryFront in front of `backend`
+    """
+    previous = _selected_backends.pop(scope, None)
+    if isinstance(previous, MemoryFront):
+        previous.flush()
+
+    if isinstance(backend, str):
+        backend = BACKEND_TYPES[backend](scope)
+
+    if migrate and backend is not scope.value and hasattr(backend, 'migrate_from'):
+        old = scope.value
+        if isinstance(old, RunScopeFile):
+            if old.exists():
+                backend.migrate_from(old)
+                old.rename(old.with_suffix(MIGRATED_SUFFIX))
+        else:
+            backend.migrate_from(old)
+
+    if front:
+        backend = MemoryFront(backend)
+
+    _selected_backends[scope] = backend
+
+    return backend
+
+
+@atexit.register
+def flush(scope: Optional[Scope] = None) -> None:
+    """
+    Write back anything stored in `scope`'s MemoryFront, every scope's if None
+    """
+    backends = [_selected_backends.get(scope)] if scope is not None else list(_selected_backends.values())
+
+    for backend in backends:
+        if isinstance(backend, MemoryFront):
+            backend.flush()
+
+
+def batch(scope: Optional[Scope] = Scope.RUN):
+    return scope.backend.batch()
+
+
+def stats(scope: Scope) -> CacheStats:
+    """
+    Empty if the scope has no MemoryFront, which is what counts
+    """
+    return getattr(scope.backend, 'stats', None) or CacheStats()
+
 
 def store(
         key: str, value: Any,
         overwrite: Optional[bool] = True,
-        scope: Optional[Scope] = Scope.RUN) -> None:
+        scope: Optional[Scope] = Scope.RUN,
+        ttl: Optional[float] = None) -> None:
+    """
+    `ttl` (in seconds) needs the scope's backend to be a MemoryFront, which it
+    is unless `select_backend` was told otherwise.
+    """
+    with trace.span('cache.store', key=key, scope=scope.name):
+        if ttl is not None:
+            return scope.backend.store(key, value, overwrite=overwrite, ttl=ttl)
 
-    return scope.value.store(key, value, overwrite=overwrite)
+        return scope.backend.store(key, value, overwrite=overwrite)
 
 
 def retrieve(
         key: str, default: Optional[Any] = NO_DEFAULT,
         scope: Optional[Scope] = Scope.RUN) -> Any:
-    return scope.value.retrieve(key, default=default)
+    with trace.span('cache.retrieve', key=key, scope=scope.name):
+        return scope.backend.retrieve(key, default=default)
+
+
+def set_refresh(refresh: bool = True) -> None:
+    """
+    Make every `memoize`d function recompute (and re-cache) its result,
+    whatever its fingerprint says. What `--refresh` on the command line does.
+    """
+    global _refresh
+    _refresh = refresh
+
+
+def refreshing() -> bool:
+    return _refresh
+
+
+def memoize(
+        fingerprint: Callable[..., Hashable],
+        scope: Optional[Scope] = Scope.USER,
+        key: Optional[str] = None):
+    """
+    Cache a function's result in `scope`, and reuse it for as long as
+    `fingerprint`, called with the same arguments, returns the same thing.
+
+    `fingerprint` should be cheap (a few stats, say), that's the point. The
+    undecorated function is available as `.uncached`.
+    """
+    def decorator(func):
+        base_key = key or '.'.join([MEMOIZE_KEY_PREFIX, func.__module__, func.__qualname__])
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            call_key = base_key
+            if args or kwargs:
+                call_key = f'{base_key}:{args!r}:{sorted(kwargs.items())!r}'
+
+            current = fingerprint(*args, **kwargs)
+            if not _refresh:
+                cached = retrieve(call_key, default=_MISSING, scope=scope)
+                if cached is not _MISSING and cached[0] == current:
+                    return cached[1]
+
+            result = func(*args, **kwargs)
+            store(call_key, (current, result), scope=scope)
+
+            return result
+
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
+
+
+def path_fingerprint(*paths: Path, pattern: Optional[str] = None) -> tuple:
+    """
+    (path, mtime_ns, size) for each of `paths` (None for missing ones), plus
+    the same for every entry directly in them matching the glob `pattern`.
+    """
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            fingerprint.append((str(path), None))
+            continue
+        fingerprint.append((str(path), stat.st_mtime_ns, stat.st_size))
+
+        if pattern is not None and Path(path).is_dir():
+            for entry in sorted(Path(path).glob(pattern)):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                fingerprint.append((str(entry), stat.st_mtime_ns, stat.st_size))
+
+    return tuple(fingerprint)
 
 
 class NotOverwriting(Exception):
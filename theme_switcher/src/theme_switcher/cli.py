@@ -1,11 +1,17 @@
 import argparse
-import fire
-import inquirer
+import sys
+from typing import Optional
 
-from theme_switcher import (config, main, regolith, sublime, terminal)
+# Everything else is imported where it's used: this runs from hotkeys, where
+# startup is most of the latency, and e.g. `--help` needs none of it.
+
+CACHE_BACKENDS_CONFIG_KEY = 'cache.backends'
 
 
 def add(parsed) -> None:
+    import inquirer
+
+    from theme_switcher import main, regolith, sublime, terminal
 
     terminal_choices = [(profile['visible-name'], profile_id) for profile_id, profile in terminal.get_profiles().items()]
     inquiries = [
@@ -25,20 +31,73 @@ def add(parsed) -> None:
 
 
 def do_list(_parsed) -> None:
+    from theme_switcher import main
+
     # TODO: verbosities
-    for theme in main.get_themes():
-        print(theme.name)
+    for name in main.get_theme_names():
+        print(name)
 
 
 def do_set(parsed) -> None:
-    theme = main.Theme.load(parsed.theme)
-    theme.activate()
+    from theme_switcher import main
+
+    # validated here rather than with argparse `choices`, so building the
+    # parser doesn't have to read the config
+    try:
+        theme = main.Theme.load(parsed.theme)
+    except main.NoSuchTheme as exc:
+        choices = ', '.join(main.get_theme_names())
+        raise SystemExit(f'{exc} Choose from: {choices}')
+
+    try:
+        results = theme.activate(force=parsed.force)
+    except main.ActivationError as exc:
+        print(main.format_report(exc.results))
+        raise SystemExit(str(exc))
+    except main.InvalidTimeout as exc:
+        raise SystemExit(str(exc))
+
+    if parsed.timings:
+        print(main.format_report(results))
 
     print(parsed)
 
 
-def entrypoint() -> None:
+def toggle(parsed=None) -> None:
+    """
+    Switch to the next theme, by replaying its precompiled plan
+    """
+    if parsed is None:
+        # run as the `toggle_theme` script
+        return entrypoint(['toggle'] + sys.argv[1:])
+
+    from theme_switcher import main, plan
+
+    try:
+        theme, results = plan.toggle(force=parsed.force)
+    except main.ActivationError as exc:
+        print(main.format_report(exc.results))
+        raise SystemExit(str(exc))
+    except main.InvalidTimeout as exc:
+        raise SystemExit(str(exc))
+
+    print(theme.name)
+    if parsed.timings:
+        print(main.format_report(results))
+
+
+def entrypoint(argv: Optional[list[str]] = None) -> None:
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--refresh', action='store_true',
+        help="Don't trust cached themes/looks/profiles, rediscover them")
+    parser.add_argument(
+        '--profile', choices=['tree', 'json', 'chrome'], default=None,
+        help='Time config loads, cache use, subprocesses and backends, and report them as '
+             'a tree, JSON, or a Chrome trace (for chrome://tracing or Perfetto)')
+    parser.add_argument(
+        '--profile-output', default=None, metavar='PATH',
+        help='Where to write the --profile report, stderr by default')
 
     subparsers = parser.add_subparsers(required=True)
 
@@ -53,9 +112,65 @@ def entrypoint() -> None:
     set_parser = subparsers.add_parser('set', aliases=['apply', 'use'])
     set_parser.set_defaults(function=do_set)
 
-    set_parser.add_argument('theme', choices=list(theme.name for theme in main.get_themes()))
-    parsed = parser.parse_args()
+    set_parser.add_argument('theme', help='A theme name, as listed by `list`')
+    set_parser.add_argument(
+        '--timings', action='store_true', help='Report how long each app took')
+    set_parser.add_argument(
+        '--force', action='store_true',
+        help='Apply to every app, even those which look to have it applied already')
+
+    toggle_parser = subparsers.add_parser('toggle')
+    toggle_parser.set_defaults(function=toggle)
+    toggle_parser.add_argument(
+        '--timings', action='store_true', help='Report how long each app took')
+    toggle_parser.add_argument(
+        '--force', action='store_true',
+        help='Apply to every app, even those which look to have it applied already')
+
+    parsed = parser.parse_args(argv)
+
+    from theme_switcher import trace
+
+    if parsed.profile:
+        trace.enable()
+
+    try:
+        with trace.span('command', function=parsed.function.__name__):
+            _run(parsed)
+    finally:
+        if parsed.profile:
+            _report_profile(trace.disable(), parsed.profile, parsed.profile_output)
+
+
+def _report_profile(spans, fmt: str, path: Optional[str]) -> None:
+    from theme_switcher import trace
+
+    if path is None:
+        trace.report(spans, fmt, sys.stderr)
+        return
+
+    # opened once there's a report to write, and closed (so flushed) as soon
+    # as it's written, not whenever the process happens to exit
+    with open(path, 'w') as output_fh:
+        trace.report(spans, fmt, output_fh)
+
+
+def _run(parsed) -> None:
+    from theme_switcher import cache, config
+
+    # e.g. `cache: {backends: {user: sqlite}}`
+    for scope_name, backend in config.get(CACHE_BACKENDS_CONFIG_KEY, default={}).items():
+        cache.select_backend(cache.Scope[scope_name.upper()], backend)
+
+    cache.set_refresh(parsed.refresh)
 
-    parsed.function(parsed)
+    try:
+        parsed.function(parsed)
+    finally:
+        if parsed.profile:
+            # normally left until exit, which is too late to be profiled
+            cache.flush()
 
 
+if __name__ == '__main__':
+    entrypoint()
@@ -1,10 +1,17 @@
 # argparse is used for typing.
 from argparse import Namespace
-from fire import Fire
+from collections import Counter
+from contextlib import contextmanager
+from copy import deepcopy
 import os
 from pathlib import Path
+from types import MappingProxyType
 from typing import Any, Optional, Union
-import yaml
+
+from theme_switcher import trace
+
+# yaml is imported where it's needed, as it's a noticeable chunk of startup
+# for commands which never read the config
 
 LOCAL_CONFIG = Path('.theme_switcher').absolute()
 USER_CONFIG = Path('~/.theme_switcher').expanduser()
@@ -15,6 +22,17 @@ CONFIG_FILES = [
 ]
 
 
+# How many times each config file has actually been run through the yaml
+# parser this process, handy for checking the parse cache is doing its job.
+PARSE_COUNTS: Counter = Counter()
+
+# path -> (stat signature, parsed document)
+_parsed_cache: dict[Path, tuple[tuple[int, int, int], Any]] = {}
+
+# ((path, stat signature) for each config file, merged snapshot)
+_snapshot_cache: Optional[tuple[tuple, 'ConfigSnapshot']] = None
+
+
 class NoValue(Exception):
     pass
 
@@ -63,64 +81,298 @@ def get(key: str, default: Optional[Any] = NoValue, parsed_args: Optional[Namesp
 
 def get_from_config_files(key):
 
+    return snapshot().get(key)
+
+
+def _stat_signature(path: Path) -> tuple[int, int, int]:
+    stat = path.stat()
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _load_conf_file(conf_file: Path, signature: Optional[tuple[int, int, int]] = None) -> Any:
+    """
+    Parsed contents of `conf_file`, only re-parsed when the file changes.
+
+    The returned document is shared between callers, so don't mutate it.
+    Raises FileNotFoundError if the file doesn't exist.
+    """
+    if signature is None:
+        signature = _stat_signature(conf_file)
+
+    try:
+        cached_signature, conf = _parsed_cache[conf_file]
+    except KeyError:
+        pass
+    else:
+        if cached_signature == signature:
+            return conf
+
+    import yaml
+    # libyaml's loader, when it's available
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+    with trace.span('config.parse', path=conf_file):
+        conf = yaml.load(conf_file.read_text(), Loader=loader)
+    PARSE_COUNTS[conf_file] += 1
+    _parsed_cache[conf_file] = (signature, conf)
+
+    return conf
+
+
+def clear_parse_cache() -> None:
+    global _snapshot_cache
+
+    _parsed_cache.clear()
+    _snapshot_cache = None
+    PARSE_COUNTS.clear()
+
+
+class ConfigSnapshot:
+    """
+    Read-only view of all config files merged into one flat, dotted-key index.
+
+    Every key, intermediate mappings included (`themes` as well as
+    `themes.dark`), resolves to the value from the highest precedence file
+    that defines it. The lower precedence definitions are kept around so
+    overrides can still be debugged.
+    """
+
+    def __init__(self, layers: list[tuple[Path, Any]]):
+        """
+        Args:
+            * layers: (path, parsed document) pairs, highest precedence first
+        """
+        index: dict[str, list[tuple[Path, Any]]] = {}
+        # dicts rather than sets to keep the files' ordering
+        children: dict[str, dict[str, None]] = {}
+
+        for path, conf in layers:
+            if isinstance(conf, dict):
+                self._flatten(conf, '', path, index, children)
+
+        self._index = MappingProxyType(index)
+        self._children = MappingProxyType({
+            prefix: tuple(names) for prefix, names in children.items()})
+
+    @classmethod
+    def _flatten(cls, conf: dict, prefix: str, path: Path, index: dict, children: dict) -> None:
+        for name, value in conf.items():
+            name = str(name)
+            key = f'{prefix}.{name}' if prefix else name
+
+            index.setdefault(key, []).append((path, value))
+            children.setdefault(prefix, {})[name] = None
+
+            if isinstance(value, dict):
+                cls._flatten(value, key, path, index, children)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def get(self, key: str) -> Any:
+        try:
+            return self._index[key][0][1]
+        except KeyError:
+            raise NoValue
+
+    def layer(self, key: str) -> Path:
+        """
+        The config file `key`'s value comes from
+        """
+        try:
+            return self._index[key][0][0]
+        except KeyError:
+            raise NoValue
+
+    def definitions(self, key: str) -> list[tuple[Path, Any]]:
+        """
+        Every (path, value) defining `key`, the winning one first
+        """
+        return list(self._index.get(key, ()))
+
+    def names(self, prefix: str) -> tuple[str, ...]:
+        """
+        The keys directly under `prefix`, precomputed when the snapshot's built
+        """
+        return self._children.get(prefix, ())
+
+    def under(self, prefix: str) -> dict[str, Any]:
+        """
+        Everything directly under `prefix`, e.g. every theme for `themes`.
+
+        Unlike `get(prefix)`, each child is resolved on its own, so children
+        from lower precedence files are included unless overridden.
+        """
+        base = f'{prefix}.' if prefix else ''
+        return {
+            name: self._index[base + name][0][1]
+            for name in self._children.get(prefix, ())}
+
+
+def snapshot() -> ConfigSnapshot:
+    """
+    The merged view of CONFIG_FILES, rebuilt only when one of them changes
+    """
+    global _snapshot_cache
+
+    signatures = []
     for conf_file in CONFIG_FILES:
-        # TODO: probably should wrap this, but eh?
         try:
-            return _get_from_conf_file(key, conf_file)
-        except NoValue:
-            pass
+            signatures.append((conf_file, _stat_signature(conf_file)))
+        except FileNotFoundError:
+            signatures.append((conf_file, None))
+    signatures = tuple(signatures)
 
-    raise NoValue
+    if _snapshot_cache is not None and _snapshot_cache[0] == signatures:
+        return _snapshot_cache[1]
+
+    with trace.span('config.snapshot'):
+        layers = []
+        for conf_file, signature in signatures:
+            if signature is None:
+                continue
+            try:
+                layers.append((conf_file, _load_conf_file(conf_file, signature)))
+            except FileNotFoundError:
+                # removed since we stat'd it
+                pass
+
+        merged = ConfigSnapshot(layers)
+    _snapshot_cache = (signatures, merged)
+
+    return merged
+
+
+class ConfigTransaction:
+    """
+    Pending changes to one config file, see `transaction`
+    """
+
+    def __init__(self, path: Path, conf: dict):
+        self.path = path
+        self.conf = conf
+        self.changed = False
+
+    def set(self, key: str, value: Any) -> bool:
+        """
+        Set the dotted `key` to `value`, returning whether that changed
+        anything
+        """
+        conf = self.conf
+        keys = key.split('.')
+
+        for this_key in keys[:-1]:
+            conf = conf.setdefault(this_key, {})
 
+        if keys[-1] in conf and conf[keys[-1]] == value:
+            return False
+
+        conf[keys[-1]] = value
+        self.changed = True
+
+        return True
+
+
+# path -> the transaction open on it, so nested ones join the outermost
+_transactions: dict[Path, ConfigTransaction] = {}
+
+
+@contextmanager
+def transaction(path: Path):
+    """
+    Make any number of `.set()`s to the config file at `path`, parsing it
+    once and writing it once, atomically, at the end. Nothing's written if
+    nothing changed, or if the block raises.
+
+    Transactions on a path that already has one open are part of that one.
+    """
+    # write through symlinks (e.g. to a dotfiles checkout), not over them
+    target = path.resolve()
+    if target in _transactions:
+        yield _transactions[target]
+        return
 
-def _get_from_conf_file(key, conf_file):
     try:
-        conf = yaml.safe_load(conf_file.read_text())
+        # the parse cache's copy is shared, so it mustn't be changed in place
+        conf = deepcopy(_load_conf_file(path)) or {}
     except FileNotFoundError:
-        raise NoValue
+        conf = {}
 
-    keys = key.split('.')
+    txn = _transactions[target] = ConfigTransaction(target, conf)
+    try:
+        yield txn
+    finally:
+        del _transactions[target]
 
-    for this_key in keys[:-1]:
-        conf = conf.setdefault(this_key, {})
+    if txn.changed:
+        _write_conf_file(target, txn.conf)
+        # we know what it holds now, no need to parse it again
+        _parsed_cache[path] = (_stat_signature(path), txn.conf)
 
-    try:
-        return conf[keys[-1]]
-    except KeyError:
-        raise NoValue
 
+def _write_conf_file(path: Path, conf: dict) -> None:
+    """
+    Replace `path` with `conf`, via a temporary file so nothing ever reads it
+    half written
+    """
+    from tempfile import NamedTemporaryFile
 
-def _set_config(key: str, value: Any, path: Path) -> bool:
+    import yaml
+    # libyaml's emitter, when it's available
+    dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
 
     try:
-        conf = yaml.safe_load(path.read_text()) or {}
+        mode = path.stat().st_mode & 0o777
     except FileNotFoundError:
-        conf = {}
-    conf_root = conf
+        mode = 0o644
 
-    keys = key.split('.')
+    with trace.span('config.write', path=path):
+        with NamedTemporaryFile(
+                'w', dir=path.parent, prefix=f'.{path.name}.', delete=False) as tmp_fh:
+            try:
+                yaml.dump(conf, tmp_fh, Dumper=dumper)
+                tmp_fh.flush()
+                os.fsync(tmp_fh.fileno())
+                os.chmod(tmp_fh.name, mode)
+            except BaseException:
+                os.unlink(tmp_fh.name)
+                raise
 
-    for this_key in keys[:-1]:
-        conf = conf.setdefault(this_key, {})
+        os.replace(tmp_fh.name, path)
 
-    if keys[-1] in conf and conf[keys[-1]] == value:
-        return False
 
-    conf[keys[-1]] = value
-    with path.open('w') as fh:
-        yaml.safe_dump(conf_root, fh)
+def use_local_dir(directory: Union[str, Path]) -> None:
+    """
+    Read (and `set_local`) the local config in `directory` from here on,
+    rather than in the directory we were started from. For the daemon, which
+    runs commands on behalf of clients started elsewhere.
+    """
+    global LOCAL_CONFIG, CONFIG_FILES
 
-    return True
+    LOCAL_CONFIG = Path(directory, '.theme_switcher').absolute()
+    CONFIG_FILES = [LOCAL_CONFIG, USER_CONFIG, GLOBAL_CONFIG]
 
 
 def set_local(key: str, value: Any) -> bool:
 
-    return _set_config(key, value, LOCAL_CONFIG)
+    with transaction(LOCAL_CONFIG) as txn:
+        return txn.set(key, value)
 
 
 def set_user(key: str, value: Any) -> bool:
 
-    return _set_config(key, value, USER_CONFIG)
+    with transaction(USER_CONFIG) as txn:
+        return txn.set(key, value)
+
+
+def watch(**kwargs):
+    """
+    Yield the set of CONFIG_FILES which changed, each time any do. Takes
+    `notify.watch`'s arguments.
+    """
+    from theme_switcher import notify
+
+    return notify.watch(CONFIG_FILES, **kwargs)
 
 
 def _get_env(key) -> str:
@@ -135,5 +387,6 @@ def _get_env(key) -> str:
 
 # Testing
 if __name__ == '__main__':
+    from fire import Fire
     #Fire(set_user)
     Fire(get)
@@ -0,0 +1,292 @@
+"""
+Optional resident server, so switching themes from a keybinding doesn't pay
+for interpreter startup, imports, config parsing and backend discovery every
+time.
+
+`theme_switchinatord` keeps all of that warm and listens on a unix socket;
+`theme_switchinator_client` takes the same arguments as `theme_switchinator`
+and forwards them, running the command itself when there's no server.
+
+Each command runs in the client's directory and environment, as it would
+have without the server.
+"""
+
+import contextlib
+import io
+import json
+import os
+import pathlib
+import signal
+import socket
+import socketserver
+from stat import S_ISDIR
+import sys
+import threading
+import traceback
+from typing import Optional
+
+SOCKET_NAME = 'theme_switcher.sock'
+# in a dir of this name (suffixed with the uid) under TMP_DIR, when there's
+# no XDG_RUNTIME_DIR
+SOCKET_DIR_NAME = 'theme_switcher'
+TMP_DIR = pathlib.Path('/tmp')
+
+# Commands the server runs, anything else (e.g. interactive ones) the client
+# runs itself
+FORWARDED_COMMANDS = {'set', 'apply', 'use', 'list', 'ls', 'toggle'}
+
+# Seconds the client waits on the server before giving up on it. Applying a
+# theme can legitimately take a while, so this is for connecting only.
+CONNECT_TIMEOUT = 0.5
+
+# Only read at import (into paths), so they can't be changed per request. A
+# client with different ones runs its command itself.
+FIXED_ENV_VARS = ('HOME', 'XDG_CONFIG_HOME')
+
+
+class NotPrivate(Exception):
+    """
+    The socket's directory could be written by someone else
+    """
+
+
+def _private_dir(path: pathlib.Path, create: bool = False) -> pathlib.Path:
+    if create:
+        try:
+            path.mkdir(mode=0o700)
+        except FileExistsError:
+            pass
+
+    # lstat, so it can't be a symlink to somewhere that is ours
+    path_stat = os.lstat(path)
+    if not S_ISDIR(path_stat.st_mode) or path_stat.st_uid != os.getuid() or path_stat.st_mode & 0o077:
+        raise NotPrivate(f'{path} must be a directory only you can use')
+
+    return path
+
+
+def socket_path(create: bool = False) -> pathlib.Path:
+    """
+    Args:
+        * create: make the socket's directory, if it's one of ours
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return pathlib.Path(runtime_dir, SOCKET_NAME)
+
+    # /tmp's shared, so anyone could have put something at a predictable
+    # path there; our own directory can't have
+    socket_dir = _private_dir(TMP_DIR.joinpath(f'{SOCKET_DIR_NAME}-{os.getuid()}'), create=create)
+    return socket_dir.joinpath(SOCKET_NAME)
+
+
+def _command(argv: list[str]) -> Optional[str]:
+    return next((arg for arg in argv if not arg.startswith('-')), None)
+
+
+@contextlib.contextmanager
+def _client_context(cwd: str, env: dict[str, str]):
+    """
+    Run as if from the client: in its directory, with its environment (which
+    config is read from) and its local config
+    """
+    from theme_switcher import config
+
+    own_cwd = os.getcwd()
+    own_env = dict(os.environ)
+    own_local_dir = config.LOCAL_CONFIG.parent
+
+    os.chdir(cwd)
+    os.environ.clear()
+    os.environ.update(env)
+    config.use_local_dir(cwd)
+    try:
+        yield
+    finally:
+        config.use_local_dir(own_local_dir)
+        os.environ.clear()
+        os.environ.update(own_env)
+        os.chdir(own_cwd)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        from theme_switcher import cache, cli
+
+        request_line = self.rfile.readline()
+        if not request_line:
+            # just checking we're here, see _server_running
+            return
+        request = json.loads(request_line)
+
+        env = request['env']
+        if any(env.get(name) != value for name, value in self.server.fixed_env.items()):
+            # status None has the client run it itself
+            self.wfile.write(json.dumps({'status': None, 'output': ''}).encode() + b'\n')
+            return
+
+        output = io.StringIO()
+        status = 0
+        with _client_context(request['cwd'], env), \
+                contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            try:
+                cli.entrypoint(request['argv'])
+            except SystemExit as exc:
+                if isinstance(exc.code, str):
+                    print(exc.code)
+                    status = 1
+                else:
+                    status = exc.code or 0
+            except Exception:
+                traceback.print_exc()
+                status = 1
+            finally:
+                # we never exit, so nothing else would write the cache back
+                cache.flush()
+
+        response = {'status': status, 'output': output.getvalue()}
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class _Server(socketserver.UnixStreamServer):
+    # one request at a time, two switches shouldn't interleave anyway
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fixed_env = dict((name, os.environ.get(name)) for name in FIXED_ENV_VARS)
+
+
+def _warm_up() -> None:
+    """
+    Import and prime everything a `set` or `list` will want
+    """
+    from theme_switcher import config, main, regolith, sublime, terminal
+
+    for prime in [config.snapshot, main.get_themes, terminal.get_backend]:
+        try:
+            prime()
+        except Exception:
+            # not fatal, it'll just be done (or fail) on first use instead
+            traceback.print_exc()
+
+
+def _rewarm(watch, prime) -> None:
+    """
+    Re-prime whenever `watch` says its sources changed, so the first request
+    after e.g. installing a package or editing the config doesn't pay for
+    rediscovering it
+    """
+    from theme_switcher import cache
+
+    for _changed in watch():
+        try:
+            prime()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            cache.flush()
+
+
+def _start_watching() -> None:
+    from theme_switcher import config, main, regolith, sublime
+
+    watchers = {
+        'config': (config.watch, lambda: (config.snapshot(), main.get_themes())),
+        'sublime': (sublime.watch, sublime.get_themes),
+        'regolith': (regolith.watch, regolith.get_looks),
+    }
+    for name, (watch, prime) in watchers.items():
+        threading.Thread(
+            target=_rewarm, args=(watch, prime), name=f'watch-{name}', daemon=True).start()
+
+
+def _server_running(path: pathlib.Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+
+    return True
+
+
+def serve() -> None:
+    try:
+        path = socket_path(create=True)
+    except NotPrivate as exc:
+        raise SystemExit(str(exc))
+
+    if path.exists():
+        if _server_running(path):
+            raise SystemExit(f'Already being served at {path}')
+        # left behind by a server that didn't get to clean up
+        path.unlink()
+
+    _warm_up()
+    _start_watching()
+
+    # so the `finally` runs when we're asked to stop
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+
+    server = _Server(str(path), _Handler)
+    path.chmod(0o600)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+
+
+def _connect() -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(str(socket_path()))
+    except BaseException:
+        sock.close()
+        raise
+    sock.settimeout(None)
+
+    return sock
+
+
+def _forward(sock: socket.socket, argv: list[str]) -> dict:
+    request = {'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)}
+    sock.sendall(json.dumps(request).encode() + b'\n')
+    with sock.makefile('rb') as response_fh:
+        return json.loads(response_fh.readline())
+
+
+def client(argv: Optional[list[str]] = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if _command(argv) in FORWARDED_COMMANDS:
+        try:
+            sock = _connect()
+        except (OSError, NotPrivate):
+            # no server, or not one we trust, do it ourselves
+            pass
+        else:
+            with sock:
+                try:
+                    response = _forward(sock, argv)
+                except (OSError, ValueError) as exc:
+                    # it may well have run the command already; doing it
+                    # again would toggle straight back, so don't
+                    raise SystemExit(f'Lost the daemon part way through `{" ".join(argv)}`: {exc}')
+
+            if response['status'] is not None:
+                sys.stdout.write(response['output'])
+                raise SystemExit(response['status'])
+
+    from theme_switcher import cli
+    cli.entrypoint(argv)
+
+
+if __name__ == '__main__':
+    serve()
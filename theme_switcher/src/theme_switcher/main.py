@@ -1,9 +1,43 @@
 from dataclasses import dataclass
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Iterable, Optional
 
-from theme_switcher import config, regolith, sublime, terminal
+from theme_switcher import cache, config, trace
+
+logger = logging.getLogger(__name__)
 
 THEMES_KEY = 'themes'
 
+# `applied.<backend>` in the user cache: the fingerprint of what each backend
+# last applied
+APPLIED_CACHE_KEY = 'applied'
+# the name of the last theme applied everywhere
+APPLIED_THEME_CACHE_KEY = 'applied_theme'
+
+# seconds each backend gets to apply a theme, e.g.
+# `activate: {timeout: {default: 20, regolith: 10}}`. A plain number for
+# `activate.timeout` still works as the default.
+ACTIVATE_TIMEOUT_CONFIG_KEY = 'activate.timeout'
+DEFAULT_TIMEOUT_NAME = 'default'
+DEFAULT_ACTIVATE_TIMEOUT = 30.0
+
+
+@dataclass
+class BackendResult:
+    name: str
+    seconds: Optional[float] = None
+    error: Optional[BaseException] = None
+    timed_out: bool = False
+    # already applied, so not run at all
+    skipped: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.timed_out
+
 
 @dataclass
 class Theme:
@@ -15,6 +49,19 @@ class Theme:
     def save(self) -> None:
         config.set_user('.'.join([THEMES_KEY, self.name]), dict(self))
 
+        import subprocess
+
+        from theme_switcher import plan, terminal
+        try:
+            plan.save_plan(plan.compile_plan(self))
+        except (OSError, subprocess.CalledProcessError, terminal.BackendUnavailable, config.NoValue):
+            # the terminal can't be read (yet), or has no active profile
+            # configured; not worth failing the save over, it's compiled on
+            # first use instead
+            pass
+        except Exception:
+            logger.debug(f'compiling the plan for {self.name} failed', exc_info=True)
+
     def __iter__(self):
         yield ('sublime_theme', self.sublime_theme)
         yield ('regolith_look', self.regolith_look)
@@ -29,21 +76,212 @@ class Theme:
 
         return cls(name, **theme_conf)
 
-    def activate(self) -> None:
-        regolith.set_look(self.regolith_look)
-        sublime.set_theme(self.sublime_theme)
+    def activate(self, force: bool = False) -> dict[str, BackendResult]:
+        """
+        Apply the theme to every app at once.
+
+        The apps are independent, so one failing or hanging doesn't stop the
+        others. Apps whose fingerprint shows they already have this theme
+        applied are skipped, unless `force`d.
+
+        Returns each backend's result, or raises ActivationError (carrying
+        them all) if any failed.
+        """
+        # the backends pull in a fair bit, and most commands never need them
+        from theme_switcher import regolith, sublime, terminal
+
         active_term_theme_id = config.get(terminal.PROFILE_ID_CONFIG_KEY)
-        terminal.patch_console_profile(
-            profile_id=active_term_theme_id,
-            source_profile_id=self.terminal_profile)
 
+        # name -> (apply, fingerprint of the state applying would leave)
+        backends = {
+            'regolith': (
+                functools.partial(regolith.set_look, self.regolith_look),
+                functools.partial(regolith.applied_fingerprint, self.regolith_look)),
+            'sublime': (
+                functools.partial(sublime.set_theme, self.sublime_theme),
+                functools.partial(sublime.applied_fingerprint, self.sublime_theme)),
+            'terminal': (
+                functools.partial(
+                    terminal.patch_console_profile,
+                    profile_id=active_term_theme_id,
+                    source_profile_id=self.terminal_profile),
+                functools.partial(
+                    terminal.applied_fingerprint,
+                    profile_id=active_term_theme_id,
+                    source_profile_id=self.terminal_profile)),
+        }
+
+        return activate_backends(self.name, backends, force=force)
+
+
+def save_themes(themes: Iterable[Theme]) -> None:
+    """
+    Save many themes with a single write of the user config
+    """
+    with config.transaction(config.USER_CONFIG):
+        for theme in themes:
+            theme.save()
+
+
+def activate_backends(
+        theme_name: str,
+        backends: dict[str, tuple[Callable[[], object], Callable[[], object]]],
+        force: bool = False) -> dict[str, BackendResult]:
+    """
+    Args:
+        * theme_name: what's being applied
+        * backends: name -> (apply, fingerprint of the state applying leaves)
+        * force: apply even where the fingerprint says it already is. A
+          fingerprint of None never says so.
+    """
+    tasks = {}
+    skipped = {}
+    for name, (apply, fingerprint) in backends.items():
+        current = None if force else fingerprint()
+        if current is not None and _last_applied(name) == current:
+            skipped[name] = BackendResult(name, seconds=0.0, skipped=True)
+        else:
+            tasks[name] = apply
+
+    results = _run_backends(tasks, dict((name, _activate_timeout(name)) for name in tasks))
+
+    for name, result in results.items():
+        if result.ok:
+            # after applying, as applying may well change what it covers
+            _record_applied(name, backends[name][1]())
+        else:
+            # whatever state it's in now, it's not known good
+            _record_applied(name, None)
+
+    results.update(skipped)
+
+    if not all(result.ok for result in results.values()):
+        raise ActivationError(theme_name, results)
+
+    cache.store(APPLIED_THEME_CACHE_KEY, theme_name, scope=cache.Scope.USER)
+
+    return results
+
+
+def applied_theme() -> Optional[str]:
+    return cache.retrieve(APPLIED_THEME_CACHE_KEY, default=None, scope=cache.Scope.USER)
+
+
+def _last_applied(backend: str):
+    return cache.retrieve(
+        f'{APPLIED_CACHE_KEY}.{backend}', default=None, scope=cache.Scope.USER)
+
+
+def _record_applied(backend: str, fingerprint) -> None:
+    cache.store(f'{APPLIED_CACHE_KEY}.{backend}', fingerprint, scope=cache.Scope.USER)
+
+
+def _timeout_value(key: str, value) -> float:
+    # bool is an int, but `timeout: yes` is surely a mistake
+    if isinstance(value, bool):
+        raise InvalidTimeout(key, value)
 
-def get_themes() -> list[Theme]:
-    # we don't want to get from all config, just from file config
     try:
-        theme_dict = config.get_from_config_files(THEMES_KEY)
-    except config.NoValue:
-        theme_dict = {}
+        return float(value)
+    except (TypeError, ValueError):
+        raise InvalidTimeout(key, value)
+
+
+def _activate_timeout(backend: str) -> float:
+    # each looked up on its own, so e.g. the user config's default and a
+    # local config's override for one backend both apply
+    for key in [f'{ACTIVATE_TIMEOUT_CONFIG_KEY}.{backend}', f'{ACTIVATE_TIMEOUT_CONFIG_KEY}.{DEFAULT_TIMEOUT_NAME}']:
+        value = config.get(key, default=None)
+        if value is not None:
+            return _timeout_value(key, value)
+
+    value = config.get(ACTIVATE_TIMEOUT_CONFIG_KEY, default=None)
+    if value is None or isinstance(value, dict):
+        return DEFAULT_ACTIVATE_TIMEOUT
+
+    return _timeout_value(ACTIVATE_TIMEOUT_CONFIG_KEY, value)
+
+
+def _run_backends(
+        tasks: dict[str, Callable[[], object]],
+        timeouts: dict[str, float]) -> dict[str, BackendResult]:
+    """
+    Run every task in its own thread, waiting at most its timeout for it.
+
+    Daemon threads rather than an executor, so a hung backend can't keep the
+    process alive once we've given up on it. Its processes are terminated
+    (see `proc`), and whatever it does after isn't reported.
+    """
+    from theme_switcher import proc
+
+    # name -> (error, seconds), written by each thread as it finishes; only
+    # read for the threads that finished in time
+    outcomes = {}
+    groups = dict((name, proc.Group()) for name in tasks)
+    parent = trace.current()
+
+    def run(name, task):
+        start = time.perf_counter()
+        error = None
+        try:
+            with proc.group(groups[name]), trace.span('apply', parent=parent, backend=name):
+                task()
+        except BaseException as exc:
+            error = exc
+        finally:
+            outcomes[name] = (error, time.perf_counter() - start)
+
+    started = time.perf_counter()
+    threads = {}
+    for name, task in tasks.items():
+        threads[name] = threading.Thread(
+            target=run, args=(name, task), name=f'activate-{name}', daemon=True)
+        threads[name].start()
+
+    results = {}
+    for name, thread in threads.items():
+        thread.join(max(timeouts[name] - (time.perf_counter() - started), 0))
+        if thread.is_alive():
+            groups[name].cancel()
+            results[name] = BackendResult(name, seconds=timeouts[name], timed_out=True)
+        else:
+            error, seconds = outcomes[name]
+            results[name] = BackendResult(name, seconds=seconds, error=error)
+
+    return results
+
+
+def format_report(results: dict[str, BackendResult]) -> str:
+    """
+    One line per backend, slowest first
+    """
+    lines = []
+    for result in sorted(results.values(), key=lambda result: -(result.seconds or 0)):
+        if result.skipped:
+            status = 'already applied'
+        elif result.timed_out:
+            status = 'timed out'
+        elif result.error is not None:
+            status = f'failed: {result.error!r}'
+        else:
+            status = 'ok'
+        lines.append(f'{result.name:<10} {result.seconds or 0:8.3f}s  {status}')
+
+    return '\n'.join(lines)
+
+
+def get_theme_names() -> tuple[str, ...]:
+    """
+    Just the names, which the config snapshot has ready without building any
+    Themes
+    """
+    return config.snapshot().names(THEMES_KEY)
+
+
+def get_themes() -> list[Theme]:
+    # we don't want to get from all config, just from file config. Themes
+    # from every file are included, more local files win on name clashes.
+    theme_dict = config.snapshot().under(THEMES_KEY)
 
     return [Theme(name=key, **vals) for key, vals in theme_dict.items()]
 
@@ -55,6 +293,23 @@ class NoSuchTheme(Exception):
         super().__init__(msg)
 
 
+class InvalidTimeout(Exception):
+    def __init__(self, key: str, value):
+        self.key = key
+        self.value = value
+        msg = f'{key} should be a number of seconds, not {value!r}'
+        super().__init__(msg)
+
+
+class ActivationError(Exception):
+    def __init__(self, name: str, results: dict[str, BackendResult]):
+        self.name = name
+        self.results = results
+        failed = ', '.join(result.name for result in results.values() if not result.ok)
+        msg = f'Activating {name} failed for: {failed}'
+        super().__init__(msg)
+
+
 if __name__ == '__main__':
     import fire
     fire.Fire(get_themes)
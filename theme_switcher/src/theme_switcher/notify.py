@@ -0,0 +1,185 @@
+"""
+Change notification for config files and the directories backends discover
+things in.
+
+inotify (through ctypes, so there's nothing to install) wakes us up where
+it's available, otherwise paths are polled. Either way what's yielded is
+decided by comparing `cache.path_fingerprint`s, the same things the caches
+are keyed on, so a change event means a cache really is stale.
+"""
+
+import ctypes
+import ctypes.util
+import os
+from pathlib import Path
+import select
+import time
+from typing import Iterable, Iterator, Optional
+
+from theme_switcher import cache
+
+# seconds between stats when there's no inotify
+POLL_INTERVAL = 1.0
+
+# seconds to let a burst of events (e.g. an editor's write, chmod and rename)
+# finish before looking at what changed
+SETTLE_SECONDS = 0.05
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x0002
+IN_ATTRIB = 0x0004
+IN_CLOSE_WRITE = 0x0008
+IN_MOVED_FROM = 0x0040
+IN_MOVED_TO = 0x0080
+IN_CREATE = 0x0100
+IN_DELETE = 0x0200
+IN_DELETE_SELF = 0x0400
+IN_MOVE_SELF = 0x0800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+
+class _Inotify:
+    """
+    Just enough of inotify to be woken up when something we're watching
+    changes; which thing it was is worked out afterwards
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        # AttributeError if this libc has no inotify
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path: Path) -> None:
+        """
+        Watching a path that's already watched is harmless, so this is just
+        called again whenever things might have moved
+        """
+        # failures (the path's gone, or we hit the watch limit) just mean
+        # we'll hear less, there's nothing else to do about them
+        self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """
+        Whether anything happened within `timeout` seconds (forever if None)
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+
+        time.sleep(SETTLE_SECONDS)
+        self._drain()
+        return True
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _inotify() -> Optional[_Inotify]:
+    try:
+        return _Inotify()
+    except (AttributeError, OSError, TypeError):
+        # not Linux, no libc found, or out of instances
+        return None
+
+
+def _watch_dirs(path: Path) -> set[Path]:
+    """
+    What to watch to hear about `path` changing: the nearest directory
+    above it which exists (so its creation, deletion or replacement is
+    seen), anything it's a symlink to, and the path itself if it's a
+    directory (so its entries are too)
+    """
+    dirs = set()
+    for this_path in {path, path.resolve()}:
+        parent = this_path.parent
+        while not parent.is_dir() and parent != parent.parent:
+            parent = parent.parent
+        dirs.add(parent)
+
+        if this_path.is_dir():
+            dirs.add(this_path)
+
+    return dirs
+
+
+def _fingerprint(path: Path) -> tuple:
+    return cache.path_fingerprint(path, pattern='*')
+
+
+def watch(
+        paths: Iterable[Path],
+        timeout: Optional[float] = None,
+        poll_interval: float = POLL_INTERVAL,
+        use_inotify: bool = True) -> Iterator[set[Path]]:
+    """
+    Yield the set of `paths` which have changed, each time any do.
+
+    Files are watched for being created, changed, replaced or deleted;
+    directories for the same, and for their entries changing (not
+    recursively).
+
+    Args:
+        * paths: files or directories, which needn't exist yet
+        * timeout: if given, an empty set is yielded each time this many
+          seconds go by without a change, so callers get a chance to stop
+        * poll_interval: seconds between checks when polling
+        * use_inotify: False to poll even where inotify's available
+    """
+    paths = [Path(path) for path in paths]
+    inotify = _inotify() if use_inotify else None
+
+    try:
+        if inotify is not None:
+            for path in paths:
+                for watch_dir in _watch_dirs(path):
+                    inotify.add_watch(watch_dir)
+
+        fingerprints = dict((path, _fingerprint(path)) for path in paths)
+        quiet_since = time.monotonic()
+
+        while True:
+            if inotify is not None:
+                remaining = None if timeout is None else max(timeout - (time.monotonic() - quiet_since), 0)
+                woken = inotify.wait(remaining)
+                if woken:
+                    # directories may have come or gone
+                    for path in paths:
+                        for watch_dir in _watch_dirs(path):
+                            inotify.add_watch(watch_dir)
+            else:
+                time.sleep(poll_interval if timeout is None else min(poll_interval, timeout))
+
+            changed = set()
+            for path in paths:
+                fingerprint = _fingerprint(path)
+                if fingerprint != fingerprints[path]:
+                    fingerprints[path] = fingerprint
+                    changed.add(path)
+
+            if changed:
+                quiet_since = time.monotonic()
+                yield changed
+            elif timeout is not None and time.monotonic() - quiet_since >= timeout:
+                quiet_since = time.monotonic()
+                yield changed
+    finally:
+        if inotify is not None:
+            inotify.close()
@@ -0,0 +1,185 @@
+"""
+Precompiled activation plans: exactly what applying a theme does to each app,
+worked out when the theme's saved, so `toggle` can replay it without reading
+anything from the apps first.
+"""
+
+from dataclasses import dataclass
+import functools
+from typing import Optional
+
+from theme_switcher import cache, config, main
+
+# {theme name: (stamp, ActivationPlan)} in the user cache, the stamp being
+# what the plan was checked against (see `_stamp`)
+PLANS_CACHE_KEY = 'activation_plans'
+
+# themes to toggle between, in order; every theme if unset
+TOGGLE_CONFIG_KEY = 'toggle.themes'
+
+
+@dataclass(frozen=True)
+class ActivationPlan:
+    theme: main.Theme
+    # the profile being themed, and the values to load into it
+    profile_id: str
+    terminal_values: tuple[tuple[str, str], ...]
+
+    def backends(self) -> dict:
+        """
+        In the form `main.activate_backends` takes
+        """
+        from theme_switcher import regolith, sublime, terminal
+
+        return {
+            'regolith': (
+                functools.partial(regolith.set_look, self.theme.regolith_look),
+                functools.partial(regolith.applied_fingerprint, self.theme.regolith_look)),
+            'sublime': (
+                functools.partial(sublime.set_theme, self.theme.sublime_theme),
+                functools.partial(sublime.applied_fingerprint, self.theme.sublime_theme)),
+            'terminal': (
+                functools.partial(
+                    terminal.get_backend().apply, self.profile_id, dict(self.terminal_values)),
+                functools.partial(
+                    terminal.applied_fingerprint,
+                    profile_id=self.profile_id,
+                    source_profile_id=self.theme.terminal_profile)),
+        }
+
+
+def _terminal_values(source_values: dict[str, str]) -> tuple[tuple[str, str], ...]:
+    from theme_switcher import terminal
+
+    return tuple(sorted(
+        (key, value) for key, value in source_values.items()
+        if key not in terminal.PRESERVED_KEYS))
+
+
+def compile_plan(theme: main.Theme, source_values: Optional[dict[str, str]] = None) -> ActivationPlan:
+    """
+    Args:
+        * source_values: the theme's terminal profile's values, if they've
+          already been read
+    """
+    from theme_switcher import terminal
+
+    if source_values is None:
+        source_values = terminal.get_backend().get_profile_values(theme.terminal_profile)
+
+    return ActivationPlan(
+        theme=theme,
+        profile_id=config.get(terminal.PROFILE_ID_CONFIG_KEY),
+        terminal_values=_terminal_values(source_values))
+
+
+def _stamp() -> dict:
+    """
+    Cheap stand ins for what plans depend on: the source profiles (in dconf),
+    and the looks and schemes installed.
+
+    dconf keeps everything in one file, so its fingerprint moves on for any
+    setting at all; when it has, the plan's source profile is read to see
+    whether it's really changed (see `get_plan`).
+    """
+    from theme_switcher import regolith, sublime, terminal
+
+    return {
+        'dconf': terminal.dconf_fingerprint(),
+        'looks': regolith.styles_fingerprint(),
+        'schemes': cache.path_fingerprint(sublime.INSTALLED_PACKAGES_DIR, sublime.PACKAGES_DIR),
+    }
+
+
+def _load_plans() -> dict[str, tuple[dict, ActivationPlan]]:
+    return cache.retrieve(PLANS_CACHE_KEY, default={}, scope=cache.Scope.USER)
+
+
+def _store_plans(plans: dict[str, tuple[dict, ActivationPlan]]) -> None:
+    cache.store(PLANS_CACHE_KEY, plans, scope=cache.Scope.USER)
+
+
+def save_plan(plan: ActivationPlan, stamp: Optional[dict] = None) -> None:
+    plans = dict(_load_plans())
+    plans[plan.theme.name] = (stamp or _stamp(), plan)
+    _store_plans(plans)
+
+
+def get_plan(theme: main.Theme) -> ActivationPlan:
+    """
+    The stored plan for `theme`, unless it's been invalidated (by its source
+    profile, the installed looks or schemes, or the theme or terminal config
+    changing), in which case it's recompiled.
+
+    Reads nothing from the apps unless dconf has changed since the plan was
+    stamped, and then only the source profile.
+    """
+    from theme_switcher import terminal
+
+    stamp = _stamp()
+    stored = _load_plans().get(theme.name)
+    if stored is None:
+        plan = compile_plan(theme)
+        save_plan(plan, stamp)
+        return plan
+
+    plan_stamp, plan = stored
+    if plan.theme != theme or plan.profile_id != config.get(terminal.PROFILE_ID_CONFIG_KEY) or any(
+            plan_stamp[key] != stamp[key] for key in ['looks', 'schemes']):
+        plan = compile_plan(theme)
+        save_plan(plan, stamp)
+    elif plan_stamp['dconf'] != stamp['dconf']:
+        # most likely some other setting entirely
+        source_values = terminal.get_backend().get_profile_values(theme.terminal_profile)
+        if _terminal_values(source_values) != plan.terminal_values:
+            plan = compile_plan(theme, source_values)
+        save_plan(plan, stamp)
+
+    return plan
+
+
+def replay(plan: ActivationPlan, force: bool = False) -> dict[str, main.BackendResult]:
+    from theme_switcher import terminal
+
+    before = terminal.dconf_fingerprint()
+    # raises if anything failed, leaving dconf in a state we haven't checked
+    results = main.activate_backends(plan.theme.name, plan.backends(), force=force)
+    after = terminal.dconf_fingerprint()
+
+    # Plans which were current just before are still current: we only wrote
+    # the active profile, which isn't anyone's source
+    plans = _load_plans()
+    restamped = {
+        name: (dict(stamp, dconf=after), stored_plan)
+        if stamp['dconf'] == before and stored_plan.theme.terminal_profile != stored_plan.profile_id
+        else (stamp, stored_plan)
+        for name, (stamp, stored_plan) in plans.items()}
+    if restamped != plans:
+        _store_plans(restamped)
+
+    return results
+
+
+def next_theme(current: Optional[str] = None) -> main.Theme:
+    """
+    The theme after `current` (the last applied, by default) in the toggle
+    order
+    """
+    names = list(config.get(TOGGLE_CONFIG_KEY, default=None) or main.get_theme_names())
+    if not names:
+        raise main.NoSuchTheme('to toggle to')
+
+    if current is None:
+        current = main.applied_theme()
+
+    try:
+        name = names[(names.index(current) + 1) % len(names)]
+    except ValueError:
+        name = names[0]
+
+    return main.Theme.load(name)
+
+
+def toggle(force: bool = False) -> tuple[main.Theme, dict[str, main.BackendResult]]:
+    theme = next_theme()
+    return theme, replay(get_plan(theme), force=force)
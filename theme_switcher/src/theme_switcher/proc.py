@@ -0,0 +1,94 @@
+"""
+Running the backends' commands so they can be stopped: `main` gives each
+backend's apply a `Group`, and cancels it if the backend times out, which
+terminates whatever it's running and refuses to start anything more.
+
+Without that, a timed out apply carries on in the background and, in the
+daemon (which never exits), can land after a later switch.
+"""
+
+from contextlib import contextmanager
+import subprocess
+import threading
+from typing import Optional
+
+_local = threading.local()
+
+
+class Cancelled(Exception):
+    """
+    The group this was run in was cancelled
+    """
+
+
+class Group:
+    """
+    The processes run by one backend's apply
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._procs: set[subprocess.Popen] = set()
+        self.cancelled = False
+
+    def _add(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            if self.cancelled:
+                proc.terminate()
+            self._procs.add(proc)
+
+    def _discard(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            self._procs.discard(proc)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            for proc in self._procs:
+                proc.terminate()
+
+
+@contextmanager
+def group(this_group: Group):
+    """
+    Run everything `run` from this thread in `this_group`
+    """
+    _local.group = this_group
+    try:
+        yield this_group
+    finally:
+        del _local.group
+
+
+def run(argv: list[str], input: Optional[bytes] = None, capture: bool = False) -> Optional[bytes]:
+    """
+    subprocess.run(argv, check=True), in the current group if there is one.
+
+    Args:
+        * input: written to its stdin
+        * capture: return its stdout
+    Raises Cancelled if the group's cancelled before or while it runs.
+    """
+    this_group = getattr(_local, 'group', None)
+    if this_group is not None and this_group.cancelled:
+        raise Cancelled(argv)
+
+    proc = subprocess.Popen(
+        argv,
+        stdin=subprocess.PIPE if input is not None else None,
+        stdout=subprocess.PIPE if capture else None)
+    if this_group is not None:
+        this_group._add(proc)
+
+    try:
+        out, _err = proc.communicate(input)
+    finally:
+        if this_group is not None:
+            this_group._discard(proc)
+
+    if this_group is not None and this_group.cancelled:
+        raise Cancelled(argv)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, argv, out)
+
+    return out
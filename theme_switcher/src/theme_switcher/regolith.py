@@ -1,19 +1,106 @@
-import fire
+import os
+import pathlib
 import subprocess
+from typing import Optional
 
+from theme_switcher import cache, proc, trace
 
+STYLES_DIR = pathlib.Path('/etc/regolith/styles')
+# what makes a directory in STYLES_DIR a look, rather than shared styles
+LOOK_ROOT_FILE = 'root'
+
+# Where `regolith-look set` records the active look, by regolith version;
+# the first that exists is the one in use
+USER_XRESOURCES_PATHS = [
+    pathlib.Path.home().joinpath('.config', config_dir, 'Xresources')
+    for config_dir in ['regolith3', 'regolith2', 'regolith']]
+
+
+def styles_fingerprint() -> tuple:
+    return cache.path_fingerprint(STYLES_DIR)
+
+
+def active_look_marker() -> Optional[tuple[str, ...]]:
+    """
+    The lines of the user's Xresources which pick the look (an `#include` of
+    its root file, or a `regolith.look` setting), None if there isn't one
+    """
+    for path in USER_XRESOURCES_PATHS:
+        try:
+            lines = path.read_text().splitlines()
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+        return tuple(line.strip() for line in lines if 'regolith.look' in line or line.startswith('#include'))
+
+    return None
+
+
+def applied_fingerprint(look: str) -> tuple:
+    """
+    Cheap stand in for the state `set_look(look)` leaves behind: which look
+    is active, so one set outside of us since is noticed, and its styles
+    """
+    return (
+        look, active_look_marker(),
+        cache.path_fingerprint(STYLES_DIR.joinpath(look), pattern='*'))
+
+
+def _looks_from_styles_dir() -> Optional[set[str]]:
+    """
+    Looks are directories in STYLES_DIR with a LOOK_ROOT_FILE in them (see
+    regolith_looks/Taskfile.yml). None if that's not what's there.
+    """
+    try:
+        entries = list(os.scandir(STYLES_DIR))
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    looks = set(
+        entry.name for entry in entries
+        if entry.is_dir() and os.path.isfile(os.path.join(entry.path, LOOK_ROOT_FILE)))
+
+    return looks or None
+
+
+def _looks_from_cli() -> set[str]:
+    with trace.span('subprocess', argv='regolith-look list'):
+        looks_out = subprocess.check_output(['regolith-look', 'list'])
+
+    return set(look.decode().strip() for look in looks_out.splitlines())
+
+
+@cache.memoize(styles_fingerprint)
 def get_looks() -> set[str]:
-    res = subprocess.check_output(['regolith-look', 'list'])
+    """
+    Read straight from STYLES_DIR, only asking `regolith-look` when the
+    layout isn't one we recognise
+    """
+    looks = _looks_from_styles_dir()
+    if looks is None:
+        looks = _looks_from_cli()
 
-    print(res)
-    return set(look.decode().strip() for look in subprocess.check_output(['regolith-look', 'list']).splitlines())
+    return looks
 
 
 def set_look(look: str) -> None:
 
-    subprocess.check_call(['regolith-look', 'set', look])
-    subprocess.check_call(['regolith-look', 'refresh'])
+    with trace.span('subprocess', argv=f'regolith-look set {look}'):
+        proc.run(['regolith-look', 'set', look])
+    with trace.span('subprocess', argv='regolith-look refresh'):
+        proc.run(['regolith-look', 'refresh'])
+
+
+def watch(**kwargs):
+    """
+    Yield STYLES_DIR each time a look's added or removed there. Takes
+    `notify.watch`'s arguments.
+    """
+    from theme_switcher import notify
+
+    return notify.watch([STYLES_DIR], **kwargs)
 
 
 if __name__ == '__main__':
+    import fire
     fire.Fire(get_looks)
@@ -2,30 +2,168 @@
 Switch themes in sublime text and merge
 """
 
-import fire
+from concurrent.futures import ThreadPoolExecutor
+import os
 import pathlib
-import subprocess
-from zipfile import ZipFile
+import re
+from typing import Callable, Optional
+from zipfile import BadZipFile, ZipFile
+
+from theme_switcher import cache, proc, trace
 
 THEME_EXT = '.tmTheme'
+COLOR_SCHEME_EXT = '.sublime-color-scheme'
+THEME_EXTS = (THEME_EXT, COLOR_SCHEME_EXT)
+PACKAGE_EXT = '.sublime-package'
 USER_CONFIG_DIR = pathlib.Path().home().joinpath('.config', 'sublime-text-3')
-USER_SETTINGS_PATH = USER_CONFIG_DIR.joinpath('Preferences.sublime-settings')
+INSTALLED_PACKAGES_DIR = USER_CONFIG_DIR.joinpath('Installed Packages')
+PACKAGES_DIR = USER_CONFIG_DIR.joinpath('Packages')
+# where sublime keeps the user's preferences, select_color_scheme included
+USER_SETTINGS_PATH = PACKAGES_DIR.joinpath('User', 'Preferences.sublime-settings')
+
+# sublime's settings are JSON with comments and trailing commas, so this is
+# pulled out with a regex rather than parsed
+COLOR_SCHEME_RE = re.compile(r'"color_scheme"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+INDEX_CACHE_KEY = 'sublime.theme_index'
+MAX_SCAN_WORKERS = 8
 
 
 def set_theme(name):
-    subprocess.check_call(['subl', '--command', '-b', f'select_color_scheme {{"name": "{name}"}}'])
+    with trace.span('subprocess', argv='subl --command select_color_scheme'):
+        proc.run(['subl', '--command', '-b', f'select_color_scheme {{"name": "{name}"}}'])
+
+
+def current_color_scheme() -> Optional[str]:
+    """
+    The color scheme in the user's preferences, as sublime itself reads it
+    """
+    try:
+        settings = USER_SETTINGS_PATH.read_text()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    match = COLOR_SCHEME_RE.search(settings)
+    return match.group(1) if match else None
+
+
+def applied_fingerprint(name: str) -> Optional[tuple]:
+    """
+    Cheap stand in for the state `set_theme(name)` leaves behind: the scheme
+    actually selected, so one picked in sublime itself since is noticed.
+
+    None until sublime's settings show `name`, as `set_theme` returns
+    before sublime's written them.
+    """
+    scheme = current_color_scheme()
+    # as given, or as a Packages/ path to it
+    if scheme is None or not (scheme == name or scheme.endswith(f'/{name}')):
+        return None
+
+    return (name, scheme)
+
+
+def _scan_archive(package: pathlib.Path) -> tuple[str, ...]:
+    try:
+        with ZipFile(package) as zf:
+            return tuple(name for name in zf.namelist() if name.endswith(THEME_EXTS))
+    except BadZipFile:
+        # indexed as empty until it changes
+        return ()
+
+
+def _scan_directory(package: pathlib.Path) -> tuple[str, ...]:
+    # relative to the package, same as the names inside archives
+    return tuple(
+        path.relative_to(package).as_posix()
+        for path in package.rglob('*') if path.name.endswith(THEME_EXTS))
+
+
+def _package_sources() -> dict[str, tuple[tuple[int, int], Callable]]:
+    """
+    path -> ((size, mtime_ns), scanner) for every archive in
+    INSTALLED_PACKAGES_DIR, and every loose package directory in
+    PACKAGES_DIR.
+
+    Loose packages are keyed on their top level directory's stat, so changes
+    further down need `--refresh` to be picked up.
+    """
+    sources = {}
+
+    for directory in [INSTALLED_PACKAGES_DIR, PACKAGES_DIR]:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+
+        for entry in entries:
+            if directory == INSTALLED_PACKAGES_DIR and entry.name.endswith(PACKAGE_EXT) and entry.is_file():
+                scanner = _scan_archive
+            elif directory == PACKAGES_DIR and entry.is_dir():
+                scanner = _scan_directory
+            else:
+                continue
+
+            stat = entry.stat()
+            sources[entry.path] = ((stat.st_size, stat.st_mtime_ns), scanner)
+
+    return sources
 
 
 def get_themes() -> set[str]:
-    package_path = USER_CONFIG_DIR.joinpath('Installed Packages')
+    """
+    Every color scheme in every installed or loose package.
+
+    Which schemes each package has is indexed in the user cache, by the
+    package's (path, size, mtime), so only new or changed packages are
+    scanned, in parallel.
+    """
+    index = {}
+    if not cache.refreshing():
+        index = cache.retrieve(INDEX_CACHE_KEY, default={}, scope=cache.Scope.USER)
+
+    sources = _package_sources()
+    stale = [
+        path for path, (signature, _scanner) in sources.items()
+        if path not in index or index[path][0] != signature]
+
+    def scan(path, parent):
+        with trace.span('sublime.scan', parent=parent, path=path):
+            return sources[path][1](pathlib.Path(path))
+
+    scanned = {}
+    if stale:
+        parent = trace.current()
+        with ThreadPoolExecutor(max_workers=min(MAX_SCAN_WORKERS, len(stale))) as pool:
+            results = pool.map(lambda path: scan(path, parent), stale)
+            scanned = dict(zip(stale, results))
+
+    # also drops packages which have gone away
+    new_index = {
+        path: (signature, scanned[path] if path in scanned else index[path][1])
+        for path, (signature, _scanner) in sources.items()}
+    if new_index != index:
+        cache.store(INDEX_CACHE_KEY, new_index, scope=cache.Scope.USER)
+
     themes = set()
-    for package in package_path.glob('*.sublime-package'):
-        zf = ZipFile(package)
-        themes.update(name for name in zf.namelist() if name.endswith(THEME_EXT))
+    for _signature, package_themes in new_index.values():
+        themes.update(package_themes)
 
     return themes
 
 
+def watch(**kwargs):
+    """
+    Yield the package directories which changed, each time any do, i.e.
+    whenever `get_themes` might find something different. Takes
+    `notify.watch`'s arguments.
+    """
+    from theme_switcher import notify
+
+    return notify.watch([INSTALLED_PACKAGES_DIR, PACKAGES_DIR], **kwargs)
+
+
 if __name__ == '__main__':
+    import fire
     # testingz
     fire.Fire(get_themes)
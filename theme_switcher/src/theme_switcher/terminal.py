@@ -1,10 +1,12 @@
 from configparser import ConfigParser
-import fire
 import io
+import os
+import pathlib
 import subprocess
 from typing import Any, Optional, Union
 import yaml
 
+from theme_switcher import cache, proc, trace
 import theme_switcher.config
 
 PROFILE_ID_CONFIG_KEY = 'terminal.active_profile_id'
@@ -15,73 +17,350 @@ PROFILE_ROOT_KEY = '/'
 
 ACTIVE_NAME = 'active'
 
+# Keys which belong to the profile itself, rather than its look
+PRESERVED_KEYS = ('visible-name',)
+
+BACKEND_CONFIG_KEY = 'terminal.backend'
+BACKEND_AUTO = 'auto'
+
+PROFILES_LIST_SCHEMA = 'org.gnome.Terminal.ProfilesList'
+PROFILE_SCHEMA = 'org.gnome.Terminal.Legacy.Profile'
+
 ConfigTypes = Union[bool, float, int]
 
+# dconf-service rewrites this on every change, so its mtime makes a cheap
+# change counter
+DCONF_USER_DB = pathlib.Path(
+    os.environ.get('XDG_CONFIG_HOME', pathlib.Path.home().joinpath('.config')),
+    'dconf', 'user')
 
-def get_profiles() -> dict[dict]:
-    dconf_out = subprocess.check_output(['dconf', 'dump', PROFILES_DCONF_KEY])
 
-    buffer = io.StringIO(dconf_out.decode())
-    config = ConfigParser()
-    config.read_file(buffer)
+def dconf_fingerprint(*_args, **_kwargs) -> tuple:
+    return cache.path_fingerprint(DCONF_USER_DB)
 
-    profile_list = yaml.safe_load(config['/']['list'])
-    config_dict = dict(
-        (pid, dict(config[f':{pid}'])) for pid in profile_list if f':{pid}' in config)
 
-    return config_dict
+def applied_fingerprint(profile_id: str, source_profile_id: str) -> tuple:
+    """
+    Cheap stand in for the state `patch_console_profile` leaves behind. Any
+    dconf change at all invalidates it, which errs on the safe side.
+    """
+    return (profile_id, source_profile_id, dconf_fingerprint())
 
 
-def _get_dconf_profile_config(profile_id: str) -> ConfigParser:
+class BackendUnavailable(Exception):
+    pass
+
+
+class DconfCliBackend:
+    """
+    Reads and writes profiles by running the `dconf` command line tool.
+
+    Values are GVariant text throughout, as `dconf dump` prints them.
+    """
+
+    name = 'dconf'
+
+    def get_profiles(self) -> dict[str, dict[str, str]]:
+        with trace.span('subprocess', argv=f'dconf dump {PROFILES_DCONF_KEY}'):
+            dconf_out = subprocess.check_output(['dconf', 'dump', PROFILES_DCONF_KEY])
+
+        config = _parse_dump(dconf_out)
+
+        profile_list = yaml.safe_load(config['/']['list'])
+        return dict(
+            (pid, dict(config[f':{pid}'])) for pid in profile_list if f':{pid}' in config)
+
+    def get_profile_values(self, profile_id: str) -> dict[str, str]:
+        """
+        The profile's (non-default) keys
+        """
+        config = _get_dconf_profile_config(profile_id)
+        if PROFILE_ROOT_KEY not in config:
+            return {}
+
+        return dict(config[PROFILE_ROOT_KEY])
+
+    def format_value(self, key: str, value: ConfigTypes) -> str:
+        return _format_dconf_value(value)
+
+    def apply(
+            self, profile_id: str,
+            changes: dict[str, str],
+            resets: Optional[list[str]] = None,
+            current: Optional[dict[str, str]] = None) -> None:
+        """
+        Write `changes` to the profile in a single `dconf load`.
+
+        dconf can't reset individual keys from a keyfile, so if there are
+        `resets`, the whole profile is reset first and everything in
+        `current` that's neither changed nor reset is loaded back along with
+        `changes`.
+        """
+        profile_key = _profile_dconf_key(profile_id)
+
+        if resets:
+            values = {
+                key: value for key, value in (current or {}).items()
+                if key not in resets}
+            values.update(changes)
+            with trace.span('subprocess', argv=f'dconf reset -f {profile_key}'):
+                proc.run(['dconf', 'reset', '-f', profile_key])
+        elif changes:
+            values = changes
+        else:
+            return
+
+        with trace.span('subprocess', argv=f'dconf load {profile_key}', keys=len(values)):
+            proc.run(['dconf', 'load', profile_key], input=_to_keyfile(values).encode())
+
+
+class GSettingsBackend:
+    """
+    Reads and writes profiles in-process, through GSettings and the terminal's
+    own schemas, so no processes are spawned and values are parsed as
+    GVariants rather than guessed at.
+
+    Values are still exchanged as GVariant text, printed the same way
+    `dconf dump` does, so both backends can be used interchangeably.
+    """
+
+    name = 'gsettings'
+
+    def __init__(self):
+        try:
+            import gi
+            gi.require_version('Gio', '2.0')
+            gi.require_version('GLib', '2.0')
+            from gi.repository import Gio, GLib
+        except (ImportError, ValueError) as exc:
+            raise BackendUnavailable(f'GSettings bindings unavailable: {exc}')
+
+        self.Gio = Gio
+        self.GLib = GLib
+
+        source = Gio.SettingsSchemaSource.get_default()
+        if source is None:
+            raise BackendUnavailable('No GSettings schemas installed')
+
+        self.list_schema = source.lookup(PROFILES_LIST_SCHEMA, True)
+        self.profile_schema = source.lookup(PROFILE_SCHEMA, True)
+        if self.list_schema is None or self.profile_schema is None:
+            raise BackendUnavailable('gnome-terminal schemas not installed')
+
+        # profile id -> Gio.Settings
+        self._profile_settings = {}
+
+    def _settings(self, profile_id: str):
+        try:
+            return self._profile_settings[profile_id]
+        except KeyError:
+            pass
+
+        settings = self.Gio.Settings.new_full(
+            self.profile_schema, None, _profile_dconf_key(profile_id))
+        self._profile_settings[profile_id] = settings
+
+        return settings
+
+    def get_profiles(self) -> dict[str, dict[str, str]]:
+        profile_list = self.Gio.Settings.new_full(
+            self.list_schema, None, PROFILES_DCONF_KEY).get_strv('list')
+
+        profiles = dict(
+            (pid, self.get_profile_values(pid)) for pid in profile_list)
+
+        # `dconf dump` only knows about profiles with something set
+        return dict((pid, values) for pid, values in profiles.items() if values)
+
+    def get_profile_values(self, profile_id: str) -> dict[str, str]:
+        """
+        The profile's (non-default) keys
+        """
+        settings = self._settings(profile_id)
+
+        values = {}
+        for key in self.profile_schema.list_keys():
+            value = settings.get_user_value(key)
+            if value is not None:
+                values[key] = value.print_(False)
+
+        return values
 
-    profile_key = f'{PROFILES_DCONF_KEY}:{profile_id}/'
+    def _value_type(self, key: str):
+        if not self.profile_schema.has_key(key):
+            raise KeyError(f'{key} is not a {PROFILE_SCHEMA} key')
 
-    dconf_out = subprocess.check_output(['dconf', 'dump', profile_key])
+        return self.profile_schema.get_key(key).get_value_type()
 
+    def format_value(self, key: str, value: ConfigTypes) -> str:
+        value_type = self._value_type(key)
+
+        # anything that isn't a string where one's expected is GVariant text
+        if isinstance(value, str) and not value_type.equal(self.GLib.VariantType.new('s')):
+            variant = self.GLib.Variant.parse(value_type, value, None, None)
+        else:
+            variant = self.GLib.Variant(value_type.dup_string(), value)
+
+        return variant.print_(False)
+
+    def apply(
+            self, profile_id: str,
+            changes: dict[str, str],
+            resets: Optional[list[str]] = None,
+            current: Optional[dict[str, str]] = None) -> None:
+        """
+        Write `changes` and reset `resets`, as one delayed apply
+        """
+        if not (changes or resets):
+            return
+
+        settings = self._settings(profile_id)
+        settings.delay()
+        try:
+            for key in resets or []:
+                settings.reset(key)
+            for key, text in changes.items():
+                settings.set_value(
+                    key, self.GLib.Variant.parse(self._value_type(key), text, None, None))
+        except BaseException:
+            settings.revert()
+            raise
+        settings.apply()
+
+        self.Gio.Settings.sync()
+
+
+BACKENDS = {
+    DconfCliBackend.name: DconfCliBackend,
+    GSettingsBackend.name: GSettingsBackend,
+}
+
+_backend = None
+
+
+def get_backend() -> Union[DconfCliBackend, GSettingsBackend]:
+    """
+    The backend named by BACKEND_CONFIG_KEY, or by default GSettings where
+    it's usable, falling back to the dconf CLI
+    """
+    global _backend
+
+    if _backend is None:
+        name = theme_switcher.config.get(BACKEND_CONFIG_KEY, default=BACKEND_AUTO)
+        if name == BACKEND_AUTO:
+            try:
+                _backend = GSettingsBackend()
+            except BackendUnavailable:
+                _backend = DconfCliBackend()
+        else:
+            _backend = BACKENDS[name]()
+
+    return _backend
+
+
+@cache.memoize(dconf_fingerprint)
+def get_profiles() -> dict[dict]:
+
+    return get_backend().get_profiles()
+
+
+def _profile_dconf_key(profile_id: str) -> str:
+    return f'{PROFILES_DCONF_KEY}:{profile_id}/'
+
+
+def _parse_dump(dconf_out: bytes) -> ConfigParser:
     buffer = io.StringIO(dconf_out.decode())
-    config = ConfigParser()
+    # values are GVariant text, which may well contain `%`s
+    config = ConfigParser(interpolation=None)
+    config.optionxform = str
     config.read_file(buffer)
 
-
     return config
 
 
-def _set_dconf_value(profile_id: str, key: str, value: ConfigTypes) -> None:
-    dconf_key = f'{PROFILES_DCONF_KEY}:{profile_id}/{key}'
+def _get_dconf_profile_config(profile_id: str) -> ConfigParser:
+
+    profile_key = _profile_dconf_key(profile_id)
+
+    with trace.span('subprocess', argv=f'dconf dump {profile_key}'):
+        dconf_out = subprocess.check_output(['dconf', 'dump', profile_key])
+
+    return _parse_dump(dconf_out)
+
+
+def _format_dconf_value(value: ConfigTypes) -> str:
+    """
+    GVariant text for `value`. Strings already quoted, or lists, are assumed
+    to be GVariant text already.
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
 
     if isinstance(value, str) and not (
             all(char == "'" for char in [value[0], value[-1]]) or
             (value[0] == '[' and value[-1] == ']')
             ):
-        value = f"'{value}'"
-    else:
-        value = str(value)
-    subprocess.check_call(['dconf', 'write', dconf_key, value])
+        return f"'{value}'"
+
+    return str(value)
+
+
+def _to_keyfile(values: dict[str, str]) -> str:
+    """
+    `values` as a keyfile for `dconf load`ing into a single profile
+    """
+    lines = [f'[{PROFILE_ROOT_KEY}]']
+    lines.extend(f'{key}={value}' for key, value in values.items())
+
+    return '\n'.join(lines) + '\n'
 
 
 def patch_console_profile(
         new_name: Optional[str] = ACTIVE_NAME,
         profile_id: Optional[str] = None,
         source_profile_id: Optional[str] = None,
-        patch: Optional[dict[str, ConfigTypes]] = None) -> None:
+        patch: Optional[dict[str, ConfigTypes]] = None,
+        reset_missing: Optional[bool] = False) -> dict[str, str]:
+    """
+    Make `profile_id` look like `source_profile_id`, plus `patch`.
+
+    Only keys which actually differ from the target profile are written, all
+    at once. With `reset_missing`, keys set on the target but not on the
+    source are reset to their defaults, too.
+
+    Returns the keys written, with their new values.
+    """
+    backend = get_backend()
 
     if profile_id is None:
         profile_id = theme_switcher.config.get(PROFILE_ID_CONFIG_KEY)
 
-    config = _get_dconf_profile_config(profile_id)
+    current = backend.get_profile_values(profile_id)
+
+    wanted = {}
     if source_profile_id is not None:
-        patch_config = _get_dconf_profile_config(source_profile_id)
-        for key, value in patch_config[PROFILE_ROOT_KEY].items():
-            if key == 'visible-name':
-                # gonna set this later
-                continue
-            _set_dconf_value(profile_id, key, value)
+        wanted.update(
+            (key, value) for key, value in backend.get_profile_values(source_profile_id).items()
+            if key not in PRESERVED_KEYS)
     if patch:
-        for key, value in patch.items():
-            _set_dconf_value(profile_id, key, value)
+        wanted.update((key, backend.format_value(key, value)) for key, value in patch.items())
+
+    changes = {
+        key: value for key, value in wanted.items() if current.get(key) != value}
+
+    resets = []
+    if reset_missing and source_profile_id is not None:
+        resets = [
+            key for key in current
+            if key not in wanted and key not in PRESERVED_KEYS]
+
+    backend.apply(profile_id, changes, resets=resets, current=current)
+
+    return changes
 
 
 if __name__ == '__main__':
+    import fire
     # for testings
 
     fire.Fire(get_profiles)
@@ -0,0 +1,206 @@
+"""
+Lightweight spans around the hot paths (config loads, cache reads and
+writes, subprocesses, backends applying), for `--profile`.
+
+Tracing is off unless `enable()`d, in which case `span()` hands back a shared
+do-nothing context manager, so instrumented code costs a global lookup and a
+call.
+"""
+
+import itertools
+import os
+import threading
+import time
+from typing import Optional, TextIO
+
+_enabled = False
+_spans: list['Span'] = []
+_ids = itertools.count(1)
+_local = threading.local()
+
+
+class Span:
+    __slots__ = ('id', 'name', 'attrs', 'parent', 'thread', 'thread_id', 'start_ns', 'end_ns')
+
+    def __init__(self, name: str, attrs: dict, parent: Optional['Span']):
+        self.id = next(_ids)
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.thread = threading.current_thread().name
+        self.thread_id = threading.get_ident()
+        self.start_ns = None
+        self.end_ns = None
+
+    def __enter__(self) -> 'Span':
+        _stack().append(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, _tb) -> None:
+        self.end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            self.attrs['error'] = repr(exc)
+        _stack().pop()
+        _spans.append(self)
+
+    @property
+    def seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+class _NullSpan:
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *_exc_info) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _stack() -> list[Span]:
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+def enable() -> None:
+    global _enabled
+
+    _spans.clear()
+    _enabled = True
+
+
+def disable() -> list[Span]:
+    """
+    Stop tracing, returning everything traced since `enable()`
+    """
+    global _enabled
+
+    _enabled = False
+    spans = sorted(_spans, key=lambda span: span.start_ns)
+    _spans.clear()
+
+    return spans
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def current() -> Optional[Span]:
+    """
+    The innermost open span on this thread, to parent spans opened on others
+    """
+    if not _enabled:
+        return None
+
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def span(name: str, parent: Optional[Span] = None, **attrs):
+    """
+    Time the `with` block as `name`.
+
+    Args:
+        * name: what's being done, e.g. `config.load`
+        * parent: the span this is part of, when it's not the innermost one
+          on this thread (e.g. work handed off to another thread)
+        * attrs: anything worth reporting alongside, e.g. the path
+    """
+    if not _enabled:
+        return _NULL_SPAN
+
+    if parent is None:
+        stack = _stack()
+        parent = stack[-1] if stack else None
+
+    return Span(name, attrs, parent)
+
+
+def _format_attrs(attrs: dict) -> str:
+    return ' '.join(f'{key}={value}' for key, value in attrs.items())
+
+
+def format_tree(spans: list[Span]) -> str:
+    children: dict[Optional[int], list[Span]] = {}
+    for this_span in spans:
+        children.setdefault(this_span.parent.id if this_span.parent else None, []).append(this_span)
+
+    lines = []
+
+    def add(this_span: Span, depth: int) -> None:
+        thread = '' if this_span.thread == 'MainThread' else f' [{this_span.thread}]'
+        lines.append(
+            f'{this_span.seconds * 1000:9.2f}ms  {"  " * depth}{this_span.name}{thread}  '
+            f'{_format_attrs(this_span.attrs)}'.rstrip())
+        for child in children.get(this_span.id, []):
+            add(child, depth + 1)
+
+    for root in children.get(None, []):
+        add(root, 0)
+
+    return '\n'.join(lines)
+
+
+def format_json(spans: list[Span]) -> str:
+    import json
+
+    origin = spans[0].start_ns if spans else 0
+    return json.dumps([
+        {
+            'id': this_span.id,
+            'parent': this_span.parent.id if this_span.parent else None,
+            'name': this_span.name,
+            'thread': this_span.thread,
+            'start': (this_span.start_ns - origin) / 1e9,
+            'seconds': this_span.seconds,
+            'attrs': this_span.attrs,
+        }
+        for this_span in spans
+    ], indent=2, default=str)
+
+
+def format_chrome(spans: list[Span]) -> str:
+    """
+    Chrome's trace event format, for chrome://tracing or Perfetto
+    """
+    import json
+
+    pid = os.getpid()
+    thread_names = dict((this_span.thread_id, this_span.thread) for this_span in spans)
+    return json.dumps({
+        'traceEvents': [
+            {
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': pid,
+                'tid': thread_id,
+                'args': {'name': thread_name},
+            }
+            for thread_id, thread_name in thread_names.items()
+        ] + [
+            {
+                'name': this_span.name,
+                'ph': 'X',
+                'ts': this_span.start_ns / 1000,
+                'dur': (this_span.end_ns - this_span.start_ns) / 1000,
+                'pid': pid,
+                'tid': this_span.thread_id,
+                'args': this_span.attrs,
+            }
+            for this_span in spans
+        ],
+        'displayTimeUnit': 'ms',
+    }, default=str)
+
+
+def report(spans: list[Span], fmt: str, output: TextIO) -> None:
+    formatter = {'tree': format_tree, 'json': format_json, 'chrome': format_chrome}[fmt]
+    output.write(formatter(spans) + '\n')
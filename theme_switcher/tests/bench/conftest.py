@@ -0,0 +1,250 @@
+"""
+A synthetic desktop for the benchmarks: fake `dconf`, `subl` and
+`regolith-look` on PATH (see bin/), a realistic number of terminal profiles,
+Installed Packages full of zips, regolith looks and a large user config, all
+under a throwaway root.
+
+They're marked `bench`, and only run when asked for with `-m bench`. Set
+BENCH_UPDATE_BASELINE=1 to write the results out as the new baseline.
+"""
+
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from zipfile import ZipFile
+
+import pytest
+
+BENCH_DIR = pathlib.Path(__file__).parent
+BIN_DIR = BENCH_DIR.joinpath('bin')
+DRIVER = BENCH_DIR.joinpath('driver.py')
+BASELINE_PATH = BENCH_DIR.joinpath('baseline.json')
+SRC_DIR = BENCH_DIR.parent.parent.joinpath('src')
+
+PROFILES_DCONF_KEY = '/org/gnome/terminal/legacy/profiles:/'
+ACTIVE_PROFILE_ID = 'b1dcc9dd-5262-4d8d-a863-c897e6d979b9'
+
+PROFILE_COUNT = 40
+KEYS_PER_PROFILE = 30
+PACKAGE_COUNT = 80
+FILES_PER_PACKAGE = 25
+SCHEMES_PER_PACKAGE = 2
+LOOK_COUNT = 20
+THEME_COUNT = 300
+
+REPEATS = int(os.environ.get('BENCH_REPEATS', 5))
+
+# Wall times are only failed on when they're this many times the baseline,
+# they're too noisy (and machine dependent) to be strict about
+WALL_TOLERANCE = float(os.environ.get('BENCH_WALL_TOLERANCE', 3.0))
+
+UPDATE_BASELINE = bool(os.environ.get('BENCH_UPDATE_BASELINE'))
+
+# command name -> measurement, for the summary and baseline
+RESULTS: dict[str, dict] = {}
+
+
+def _profile_id(index: int) -> str:
+    return f'{index:08x}-0000-4000-8000-{index:012x}'
+
+
+def _write_dconf_db(path: pathlib.Path) -> list[str]:
+    profile_ids = [ACTIVE_PROFILE_ID] + [_profile_id(index) for index in range(1, PROFILE_COUNT)]
+
+    db = {f'{PROFILES_DCONF_KEY}list': repr(profile_ids)}
+    for index, profile_id in enumerate(profile_ids):
+        profile_key = f'{PROFILES_DCONF_KEY}:{profile_id}/'
+        db[f'{profile_key}visible-name'] = repr(f'Profile {index}')
+        db[f'{profile_key}use-theme-colors'] = 'false'
+        db[f'{profile_key}palette'] = repr([f'#{index:02x}{color:04x}' for color in range(16)])
+        for key_index in range(KEYS_PER_PROFILE - 3):
+            db[f'{profile_key}setting-{key_index}'] = repr(f'value-{index}-{key_index}')
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(db))
+
+    return profile_ids
+
+
+def _write_packages(packages_dir: pathlib.Path) -> list[str]:
+    schemes = []
+    packages_dir.mkdir(parents=True)
+
+    for index in range(PACKAGE_COUNT):
+        with ZipFile(packages_dir.joinpath(f'Package {index}.sublime-package'), 'w') as zf:
+            for file_index in range(FILES_PER_PACKAGE):
+                if file_index < SCHEMES_PER_PACKAGE:
+                    name = f'Scheme {index}-{file_index}.sublime-color-scheme'
+                    schemes.append(name)
+                else:
+                    name = f'src/module_{file_index}.py'
+                zf.writestr(name, f'# {name}\n' * 50)
+
+    return schemes
+
+
+def _write_looks(styles_dir: pathlib.Path) -> list[str]:
+    looks = [f'look-{index}' for index in range(LOOK_COUNT)]
+    for look in looks:
+        look_dir = styles_dir.joinpath(look)
+        look_dir.mkdir(parents=True)
+        look_dir.joinpath('root').write_text(f'#include "{look_dir}/colors"\n')
+        look_dir.joinpath('colors').write_text(f'#define color_base03 #{len(look):06x}\n')
+
+    return looks
+
+
+def _write_user_config(path: pathlib.Path, profile_ids, schemes, looks) -> list[str]:
+    import yaml
+
+    themes = {
+        f'theme-{index}': {
+            'sublime_theme': schemes[index % len(schemes)],
+            'regolith_look': looks[index % len(looks)],
+            'terminal_profile': profile_ids[1 + index % (len(profile_ids) - 1)],
+        }
+        for index in range(THEME_COUNT)
+    }
+    # and plenty that isn't themes, as a long lived config would have
+    unrelated = {
+        f'section-{index}': {f'key-{key}': f'value-{key}' for key in range(20)}
+        for index in range(50)
+    }
+
+    path.write_text(yaml.safe_dump({'themes': themes, **unrelated}))
+
+    return list(themes)
+
+
+class BenchEnv:
+
+    def __init__(self, root: pathlib.Path):
+        self.home = root.joinpath('home')
+        self.workdir = root.joinpath('work')
+        self.log_path = root.joinpath('calls.log')
+        self.workdir.mkdir(parents=True)
+
+        config_home = self.home.joinpath('.config')
+        self.styles_dir = root.joinpath('styles')
+        self.looks = _write_looks(self.styles_dir)
+        self.profile_ids = _write_dconf_db(config_home.joinpath('dconf', 'user'))
+        self.schemes = _write_packages(config_home.joinpath('sublime-text-3', 'Installed Packages'))
+        self.theme_names = _write_user_config(
+            self.home.joinpath('.theme_switcher'), self.profile_ids, self.schemes, self.looks)
+        self.workdir.joinpath('.theme_switcher').write_text(
+            f'terminal:\n  active_profile_id: {ACTIVE_PROFILE_ID}\n  backend: dconf\n')
+
+        # nothing from the real session, DBUS_* especially: GSettings would
+        # reach the real desktop through it
+        env = {
+            key: value for key, value in os.environ.items()
+            if not key.startswith(('XDG_', 'DBUS_', 'PYTHON', 'BENCH_'))}
+        env.update(
+            HOME=str(self.home),
+            XDG_CONFIG_HOME=str(config_home),
+            XDG_RUNTIME_DIR=str(root),
+            PATH=os.pathsep.join([str(BIN_DIR), env.get('PATH', '')]),
+            PYTHONPATH=str(SRC_DIR),
+            BENCH_LOG=str(self.log_path),
+            BENCH_LOOKS=','.join(self.looks),
+            BENCH_STYLES_DIR=str(self.styles_dir))
+        self.env = env
+
+    def run(self, argv: list[str], answers: dict = None) -> dict:
+        """
+        Run a command once, returning its wall time, subprocesses and parses
+        """
+        stats_path = self.workdir.joinpath('stats.json')
+        self.log_path.write_text('')
+
+        env = self.env
+        if answers is not None:
+            env = dict(env, BENCH_ADD_ANSWERS=json.dumps(answers))
+
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, str(DRIVER), str(stats_path)] + argv,
+            env=env, cwd=self.workdir, capture_output=True, text=True)
+        seconds = time.perf_counter() - start
+
+        stats = json.loads(stats_path.read_text())
+        assert proc.returncode == 0 and stats['status'] == 0, proc.stdout + proc.stderr
+
+        return {
+            'seconds': seconds,
+            'subprocesses': len(self.log_path.read_text().splitlines()),
+            'yaml_parses': stats['yaml_parses'],
+        }
+
+    def measure(self, argv_for, answers: dict = None) -> dict:
+        """
+        Run `argv_for(repeat)` once to warm the caches up, as they would be
+        day to day, then REPEATS more times.
+
+        Wall time is the median; the counts are the worst of any run.
+        """
+        self.run(argv_for(-1), answers)
+        runs = [self.run(argv_for(repeat), answers) for repeat in range(REPEATS)]
+
+        return {
+            'seconds': round(statistics.median(run['seconds'] for run in runs), 4),
+            'subprocesses': max(run['subprocesses'] for run in runs),
+            'yaml_parses': max(run['yaml_parses'] for run in runs),
+        }
+
+
+@pytest.fixture(scope='session')
+def bench_env(tmp_path_factory) -> BenchEnv:
+    return BenchEnv(tmp_path_factory.mktemp('bench'))
+
+
+@pytest.fixture(scope='session')
+def check_baseline():
+    """
+    Record a command's measurement, and fail if it's regressed from the
+    baseline
+    """
+    baseline = {}
+    if not UPDATE_BASELINE and BASELINE_PATH.exists():
+        baseline = json.loads(BASELINE_PATH.read_text())
+
+    def check(name: str, result: dict) -> None:
+        RESULTS[name] = result
+
+        expected = baseline.get(name)
+        if expected is None:
+            return
+
+        assert result['subprocesses'] <= expected['subprocesses']
+        assert result['yaml_parses'] <= expected['yaml_parses']
+        assert result['seconds'] <= expected['seconds'] * WALL_TOLERANCE
+
+    return check
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+
+    terminalreporter.section('theme_switcher benchmarks')
+    terminalreporter.write_line(
+        f'{"command":<10} {"wall (s)":>10} {"baseline":>10} '
+        f'{"subprocs":>9} {"baseline":>9} {"parses":>7} {"baseline":>9}')
+    for name, result in RESULTS.items():
+        expected = baseline.get(name, {})
+        terminalreporter.write_line(
+            f'{name:<10} {result["seconds"]:>10.4f} {expected.get("seconds", "-"):>10} '
+            f'{result["subprocesses"]:>9} {expected.get("subprocesses", "-"):>9} '
+            f'{result["yaml_parses"]:>7} {expected.get("yaml_parses", "-"):>9}')
+
+
+def pytest_sessionfinish(session):
+    if UPDATE_BASELINE and RESULTS:
+        BASELINE_PATH.write_text(json.dumps(RESULTS, indent=2, sort_keys=True) + '\n')
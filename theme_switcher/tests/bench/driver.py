@@ -0,0 +1,47 @@
+"""
+Runs one theme_switchinator command as the installed script would, then
+writes out what it cost that can't be seen from outside the process.
+
+    python driver.py STATS_PATH [theme_switchinator args...]
+
+`add` is interactive, so with BENCH_ADD_ANSWERS (JSON) set, inquirer's
+prompt answers with those instead of asking. Everything up to the prompt,
+i.e. discovering the choices, is still done for real.
+
+Regolith's looks are read from BENCH_STYLES_DIR rather than the machine's
+own /etc/regolith/styles.
+"""
+
+import json
+import os
+import pathlib
+import sys
+
+
+def main():
+    stats_path, *argv = sys.argv[1:]
+
+    answers = os.environ.get('BENCH_ADD_ANSWERS')
+    if answers:
+        import inquirer
+        inquirer.prompt = lambda _inquiries: json.loads(answers)
+
+    from theme_switcher import cli, regolith
+    regolith.STYLES_DIR = pathlib.Path(os.environ['BENCH_STYLES_DIR'])
+
+    status = 0
+    try:
+        cli.entrypoint(argv)
+    except SystemExit as exc:
+        status = exc.code if isinstance(exc.code, int) else 1
+
+    # only there if the command needed the config at all
+    config = sys.modules.get('theme_switcher.config')
+    yaml_parses = sum(config.PARSE_COUNTS.values()) if config else 0
+
+    with open(stats_path, 'w') as stats_fh:
+        json.dump({'status': status, 'yaml_parses': yaml_parses}, stats_fh)
+
+
+if __name__ == '__main__':
+    main()
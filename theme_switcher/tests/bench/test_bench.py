@@ -0,0 +1,41 @@
+"""
+Latency of each command against the synthetic desktop in conftest, compared
+with baseline.json
+"""
+
+import importlib.util
+
+import pytest
+
+pytestmark = pytest.mark.bench
+
+
+def test_list(bench_env, check_baseline):
+    check_baseline('list', bench_env.measure(lambda _repeat: ['list']))
+
+
+def test_set(bench_env, check_baseline):
+    # alternating, so every run really applies something rather than finding
+    # it's already applied
+    result = bench_env.measure(lambda repeat: ['set', bench_env.theme_names[repeat % 2]])
+    check_baseline('set', result)
+
+
+def test_set_noop(bench_env, check_baseline):
+    result = bench_env.measure(lambda _repeat: ['set', bench_env.theme_names[0]])
+    check_baseline('set_noop', result)
+
+
+def test_toggle(bench_env, check_baseline):
+    check_baseline('toggle', bench_env.measure(lambda _repeat: ['toggle']))
+
+
+@pytest.mark.skipif(not importlib.util.find_spec('inquirer'), reason='inquirer is not installed')
+def test_add(bench_env, check_baseline):
+    answers = {
+        'name': 'benchmarked',
+        'sublime_theme': bench_env.schemes[0],
+        'regolith_look': bench_env.looks[0],
+        'terminal_profile': bench_env.profile_ids[1],
+    }
+    check_baseline('add', bench_env.measure(lambda _repeat: ['add'], answers))
@@ -0,0 +1,32 @@
+from theme_switcher import regolith, sublime
+
+
+def test_sublime_fingerprint_follows_color_scheme(tmp_path, monkeypatch):
+    settings = tmp_path.joinpath('Packages', 'User', 'Preferences.sublime-settings')
+    monkeypatch.setattr(sublime, 'USER_SETTINGS_PATH', settings)
+
+    # sublime hasn't caught up yet
+    assert sublime.applied_fingerprint('Dark.sublime-color-scheme') is None
+
+    settings.parent.mkdir(parents=True)
+    settings.write_text(
+        '{\n    // picked in sublime\n    "color_scheme": "Packages/Light/Light.sublime-color-scheme",\n'
+        '    "font_size": 11,\n}\n')
+    assert sublime.applied_fingerprint('Dark.sublime-color-scheme') is None
+    assert sublime.applied_fingerprint('Light.sublime-color-scheme') == (
+        'Light.sublime-color-scheme', 'Packages/Light/Light.sublime-color-scheme')
+
+
+def test_regolith_fingerprint_follows_active_look(tmp_path, monkeypatch):
+    xresources = tmp_path.joinpath('regolith', 'Xresources')
+    monkeypatch.setattr(regolith, 'USER_XRESOURCES_PATHS', [tmp_path.joinpath('regolith2', 'Xresources'), xresources])
+    monkeypatch.setattr(regolith, 'STYLES_DIR', tmp_path.joinpath('styles'))
+
+    xresources.parent.mkdir()
+    xresources.write_text('#include "/etc/regolith/styles/dark/root"\nother.setting: 1\n')
+    dark = regolith.applied_fingerprint('dark')
+    assert dark[1] == ('#include "/etc/regolith/styles/dark/root"',)
+
+    # switched outside of us
+    xresources.write_text('#include "/etc/regolith/styles/light/root"\nother.setting: 1\n')
+    assert regolith.applied_fingerprint('dark') != dark
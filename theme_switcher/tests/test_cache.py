@@ -0,0 +1,37 @@
+import time
+
+from theme_switcher import cache
+
+
+def test_restoring_with_ttl_refreshes_expiry(monkeypatch):
+    front = cache.MemoryFront(cache.RunScopeSqlite())
+    now = time.time()
+    monkeypatch.setattr(cache.time, 'time', lambda: now)
+
+    assert front.store('key', 'value', ttl=10)
+    assert front.store('key', 'value', ttl=100)
+    # the same value, with no ttl change to make, is still a no-op
+    assert not front.store('key', 'value', ttl=100)
+
+    now += 50
+    assert front.retrieve('key') == 'value'
+
+    front.flush()
+    assert front.backend.retrieve('key') == cache.Expiring('value', now - 50 + 100)
+
+
+def test_storing_without_ttl_clears_expiry():
+    front = cache.MemoryFront(cache.RunScopeSqlite())
+
+    assert front.store('key', 'value', ttl=10)
+    assert front.store('key', 'value')
+    assert not front.store('key', 'value')
+
+    front.flush()
+    assert front.backend.retrieve('key') == 'value'
+
+
+def test_stats_without_front(monkeypatch):
+    monkeypatch.setitem(cache._selected_backends, cache.Scope.RUN, cache.RunScopeSqlite())
+
+    assert cache.stats(cache.Scope.RUN) == cache.CacheStats()
@@ -0,0 +1,14 @@
+import json
+
+from theme_switcher import cli, config
+
+
+def test_profile_output_is_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG_FILES', [])
+    monkeypatch.setattr(cli, 'do_list', lambda parsed: None)
+    output = tmp_path.joinpath('profile.json')
+
+    cli.entrypoint(['--profile', 'json', '--profile-output', str(output), 'list'])
+
+    (command,) = [span for span in json.loads(output.read_text()) if span['name'] == 'command']
+    assert command['attrs'] == {'function': '<lambda>'}
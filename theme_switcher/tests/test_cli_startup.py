@@ -0,0 +1,58 @@
+"""
+Startup budget for the CLI, which mostly runs from hotkeys
+"""
+
+import os
+import pathlib
+import subprocess
+import sys
+
+SRC_DIR = pathlib.Path(__file__).parent.parent.joinpath('src')
+
+# Cumulative microseconds to import theme_switcher.cli. Generous, the module
+# checks below are what catch regressions; this catches anything else heavy.
+CLI_IMPORT_BUDGET_US = 100_000
+
+# Not needed to start up, or to run `--help`
+HEAVY_MODULES = {'fire', 'inquirer', 'gi', 'yaml', 'sqlite3', 'zipfile', 'concurrent.futures'}
+
+
+def _importtime(code: str, tmp_path: pathlib.Path) -> dict[str, int]:
+    """
+    module -> cumulative import microseconds, from `python -X importtime`
+    """
+    env = dict(os.environ, PYTHONPATH=str(SRC_DIR), HOME=str(tmp_path))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        env=env, cwd=tmp_path, capture_output=True, text=True)
+
+    imported = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        imported[module.strip()] = int(cumulative_us)
+
+    return imported
+
+
+def test_cli_import_budget(tmp_path):
+    imported = _importtime('import theme_switcher.cli', tmp_path)
+
+    assert not HEAVY_MODULES & imported.keys()
+    assert imported['theme_switcher.cli'] < CLI_IMPORT_BUDGET_US
+
+
+def test_help_reads_nothing(tmp_path):
+    code = (
+        'import sys; sys.argv = ["theme_switchinator", "set", "--help"]\n'
+        'from theme_switcher import cli\n'
+        'try:\n'
+        '    cli.entrypoint()\n'
+        'except SystemExit:\n'
+        '    pass\n')
+    imported = _importtime(code, tmp_path)
+
+    assert 'theme_switcher.cli' in imported
+    assert not HEAVY_MODULES & imported.keys()
+    assert 'theme_switcher.config' not in imported
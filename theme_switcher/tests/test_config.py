@@ -0,0 +1,70 @@
+import pytest
+import yaml
+
+from theme_switcher import config
+
+
+@pytest.fixture
+def conf_path(tmp_path):
+    config.clear_parse_cache()
+    path = tmp_path.joinpath('.theme_switcher')
+    path.write_text(yaml.safe_dump({'themes': {'dark': {'regolith_look': 'ayu-dark'}}}))
+    yield path
+    config.clear_parse_cache()
+
+
+def test_transaction_writes_once(conf_path, monkeypatch):
+    writes = []
+    write_conf_file = config._write_conf_file
+    monkeypatch.setattr(
+        config, '_write_conf_file', lambda *args: writes.append(args) or write_conf_file(*args))
+
+    with config.transaction(conf_path) as txn:
+        for name in ['light', 'dusk', 'dawn']:
+            assert txn.set(f'themes.{name}.regolith_look', name)
+            # joins the open transaction rather than writing
+            with config.transaction(conf_path) as nested:
+                assert nested is txn
+
+    assert len(writes) == 1
+    conf = yaml.safe_load(conf_path.read_text())
+    assert set(conf['themes']) == {'dark', 'light', 'dusk', 'dawn'}
+
+    # and what was written is already known, without parsing it again
+    parses = sum(config.PARSE_COUNTS.values())
+    assert config._load_conf_file(conf_path) == conf
+    assert sum(config.PARSE_COUNTS.values()) == parses
+
+
+def test_unchanged_skips_write(conf_path):
+    before = conf_path.stat()
+
+    with config.transaction(conf_path) as txn:
+        assert not txn.set('themes.dark.regolith_look', 'ayu-dark')
+
+    assert conf_path.stat().st_ino == before.st_ino
+    assert conf_path.stat().st_mtime_ns == before.st_mtime_ns
+
+
+def test_error_discards_changes(conf_path):
+    original = conf_path.read_text()
+
+    with pytest.raises(RuntimeError):
+        with config.transaction(conf_path) as txn:
+            txn.set('themes.light.regolith_look', 'ayu-light')
+            raise RuntimeError
+
+    assert conf_path.read_text() == original
+    # nor has the parse cache's copy been changed
+    assert 'light' not in config._load_conf_file(conf_path)['themes']
+
+
+def test_writes_through_symlinks(conf_path, tmp_path):
+    link = tmp_path.joinpath('link')
+    link.symlink_to(conf_path)
+
+    with config.transaction(link) as txn:
+        txn.set('terminal.active_profile_id', 'abc')
+
+    assert link.is_symlink()
+    assert yaml.safe_load(conf_path.read_text())['terminal']['active_profile_id'] == 'abc'
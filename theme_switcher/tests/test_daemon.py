@@ -0,0 +1,116 @@
+import os
+import threading
+
+import pytest
+import yaml
+
+from theme_switcher import config, daemon
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """
+    A daemon serving from `tmp_path/server`, with a `list` that reports
+    the local config and environment it ran with
+    """
+    from theme_switcher import cli
+
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    server_dir = tmp_path.joinpath('server')
+    server_dir.mkdir()
+    monkeypatch.chdir(server_dir)
+    monkeypatch.setattr(config, 'LOCAL_CONFIG', server_dir.joinpath('.theme_switcher'))
+    # and the user and global config too, as use_local_dir puts them back in
+    monkeypatch.setattr(config, 'USER_CONFIG', tmp_path.joinpath('user_config.yml'))
+    monkeypatch.setattr(config, 'GLOBAL_CONFIG', tmp_path.joinpath('global_config.yml'))
+    monkeypatch.setattr(config, 'CONFIG_FILES', [config.LOCAL_CONFIG])
+    config.clear_parse_cache()
+
+    def entrypoint(argv):
+        print(config.LOCAL_CONFIG.parent, os.getcwd(), os.environ.get('THEME_SWITCHER_TEST'))
+        print(config.get('greeting', default=None))
+
+    monkeypatch.setattr(cli, 'entrypoint', entrypoint)
+
+    path = daemon.socket_path(create=True)
+    srv = daemon._Server(str(path), daemon._Handler)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield server_dir
+    srv.shutdown()
+    srv.server_close()
+    config.clear_parse_cache()
+
+
+def _forward(argv):
+    with daemon._connect() as sock:
+        return daemon._forward(sock, argv)
+
+
+def test_runs_in_the_clients_context(server, tmp_path, monkeypatch):
+    client_dir = tmp_path.joinpath('client')
+    client_dir.mkdir()
+    client_dir.joinpath('.theme_switcher').write_text(yaml.safe_dump({'greeting': 'hi'}))
+    monkeypatch.chdir(client_dir)
+    monkeypatch.setenv('THEME_SWITCHER_TEST', 'from the client')
+
+    response = _forward(['list'])
+
+    assert response['status'] == 0
+    assert response['output'].splitlines() == [f'{client_dir} {client_dir} from the client', 'hi']
+    # and it's back to its own afterwards
+    assert config.LOCAL_CONFIG.parent == server
+    assert os.getcwd() == str(client_dir)
+
+
+def test_declines_other_homes(server, monkeypatch):
+    monkeypatch.setenv('HOME', '/somewhere/else')
+
+    assert _forward(['list'])['status'] is None
+
+
+def test_tmp_socket_dir_is_private(tmp_path, monkeypatch):
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setattr(daemon, 'TMP_DIR', tmp_path)
+
+    path = daemon.socket_path(create=True)
+    assert path.parent.parent == tmp_path
+    assert (path.parent.stat().st_mode & 0o777) == 0o700
+
+    path.parent.chmod(0o777)
+    with pytest.raises(daemon.NotPrivate):
+        daemon.socket_path()
+
+
+def test_no_server_runs_locally(tmp_path, monkeypatch):
+    from theme_switcher import cli
+
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    ran = []
+    monkeypatch.setattr(cli, 'entrypoint', ran.append)
+
+    daemon.client(['toggle'])
+    assert ran == [['toggle']]
+
+
+def test_lost_server_does_not_run_again(tmp_path, monkeypatch):
+    from theme_switcher import cli
+
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    ran = []
+    monkeypatch.setattr(cli, 'entrypoint', ran.append)
+
+    def hang_up(_sock, _argv):
+        raise ConnectionResetError('gone')
+
+    path = daemon.socket_path(create=True)
+    srv = daemon._Server(str(path), daemon._Handler)
+    monkeypatch.setattr(daemon, '_forward', hang_up)
+    try:
+        with pytest.raises(SystemExit) as exc_info:
+            daemon.client(['toggle'])
+    finally:
+        srv.server_close()
+
+    assert 'toggle' in str(exc_info.value)
+    assert ran == []
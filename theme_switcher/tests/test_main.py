@@ -0,0 +1,106 @@
+import pytest
+import yaml
+
+from theme_switcher import config, main
+
+
+@pytest.fixture
+def conf_files(tmp_path, monkeypatch):
+    """
+    Write the local and user configs, as dicts
+    """
+    local_path = tmp_path.joinpath('local')
+    user_path = tmp_path.joinpath('user')
+    monkeypatch.setattr(config, 'CONFIG_FILES', [local_path, user_path])
+    config.clear_parse_cache()
+
+    def write(local=None, user=None):
+        for path, conf in [(local_path, local), (user_path, user)]:
+            if conf is not None:
+                path.write_text(yaml.safe_dump(conf))
+
+    yield write
+    config.clear_parse_cache()
+
+
+def _timeouts(value):
+    return {'activate': {'timeout': value}}
+
+
+def test_timeout_unset(conf_files):
+    conf_files(user={})
+    assert main._activate_timeout('regolith') == main.DEFAULT_ACTIVATE_TIMEOUT
+
+
+def test_timeout_scalar_is_the_default(conf_files):
+    conf_files(user=_timeouts(12))
+    assert main._activate_timeout('regolith') == 12.0
+
+
+def test_timeout_per_backend_only(conf_files):
+    # other backends aren't affected by one being overridden
+    conf_files(user=_timeouts({'regolith': 10}))
+    assert main._activate_timeout('regolith') == 10.0
+    assert main._activate_timeout('terminal') == main.DEFAULT_ACTIVATE_TIMEOUT
+
+
+def test_timeout_mixed(conf_files):
+    conf_files(local=_timeouts({'regolith': '10'}), user=_timeouts({'default': 20, 'sublime': 5}))
+    assert main._activate_timeout('regolith') == 10.0
+    assert main._activate_timeout('sublime') == 5.0
+    assert main._activate_timeout('terminal') == 20.0
+
+
+@pytest.mark.parametrize('value, key', [
+    ('soon', 'activate.timeout'),
+    ({'regolith': 'soon'}, 'activate.timeout.regolith'),
+    ({'default': [1]}, 'activate.timeout.default'),
+    ({'regolith': True}, 'activate.timeout.regolith'),
+])
+def test_timeout_invalid(conf_files, value, key):
+    conf_files(user=_timeouts(value))
+    with pytest.raises(main.InvalidTimeout, match=key):
+        main._activate_timeout('regolith')
+
+
+def test_unknown_fingerprint_never_skips(conf_files, monkeypatch):
+    from theme_switcher import cache
+
+    conf_files(user={})
+    monkeypatch.setitem(cache._selected_backends, cache.Scope.USER, cache.RunScopeSqlite())
+    applied = []
+
+    # as sublime's, when it hasn't written its settings yet
+    backends = {'sublime': (lambda: applied.append('dark'), lambda: None)}
+    main.activate_backends('dark', backends)
+    main.activate_backends('dark', backends)
+
+    assert applied == ['dark', 'dark']
+
+
+def test_timed_out_backend_is_stopped():
+    import threading
+    import time
+
+    from theme_switcher import proc
+
+    ran_after = []
+
+    def hangs():
+        proc.run(['sleep', '30'])
+        ran_after.append(True)
+
+    started = time.perf_counter()
+    results = main._run_backends({'slow': hangs}, {'slow': 0.2})
+    result = results['slow']
+    assert result.timed_out and result.error is None
+
+    # its sleep's terminated, so the thread's done well before the 30s
+    for thread in [thread for thread in threading.enumerate() if thread.name == 'activate-slow']:
+        thread.join(5)
+        assert not thread.is_alive()
+    assert time.perf_counter() - started < 5
+
+    # and nothing it did after made it into what was reported
+    assert ran_after == []
+    assert results['slow'] == main.BackendResult('slow', seconds=0.2, timed_out=True)
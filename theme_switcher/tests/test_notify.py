@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from theme_switcher import notify
+
+
+@pytest.fixture(params=[True, False], ids=['inotify', 'polling'])
+def use_inotify(request):
+    if request.param and notify._inotify() is None:
+        pytest.skip('no inotify here')
+    return request.param
+
+
+def _later(action, delay=0.2):
+    timer = threading.Timer(delay, action)
+    timer.start()
+    return timer
+
+
+def _next_change(watcher, deadline=5.0):
+    end = time.monotonic() + deadline
+    for changed in watcher:
+        if changed or time.monotonic() > end:
+            return changed
+
+
+def test_file_created_changed_replaced(tmp_path, use_inotify):
+    conf = tmp_path.joinpath('sub', '.theme_switcher')
+    other = tmp_path.joinpath('other')
+    other.write_text('x')
+    watcher = notify.watch([conf], timeout=0.1, poll_interval=0.05, use_inotify=use_inotify)
+    next(watcher)
+
+    def create():
+        conf.parent.mkdir()
+        conf.write_text('a: 1\n')
+    _later(create)
+    assert _next_change(watcher) == {conf}
+
+    _later(lambda: conf.write_text('a: 22\n'))
+    assert _next_change(watcher) == {conf}
+
+    def replace():
+        tmp = conf.with_name('tmp')
+        tmp.write_text('a: 333\n')
+        tmp.replace(conf)
+    _later(replace)
+    assert _next_change(watcher) == {conf}
+
+    # nothing we're watching
+    _later(lambda: other.write_text('y'))
+    assert _next_change(watcher, deadline=0.5) == set()
+
+    watcher.close()
+
+
+def test_directory_entries(tmp_path, use_inotify):
+    packages = tmp_path.joinpath('Installed Packages')
+    packages.mkdir()
+    watcher = notify.watch([packages], timeout=0.1, poll_interval=0.05, use_inotify=use_inotify)
+    next(watcher)
+
+    _later(lambda: packages.joinpath('New.sublime-package').write_bytes(b'PK'))
+    assert _next_change(watcher) == {packages}
+
+    watcher.close()
@@ -0,0 +1,108 @@
+import pytest
+
+from theme_switcher import cache, config, main, plan, regolith, terminal
+
+PROFILE_ID = 'active-profile'
+
+
+class FakeBackend:
+
+    def __init__(self):
+        self.profiles = {'dark-source': {'background-color': "'#000000'", 'visible-name': "'Dark'"}}
+        self.reads = 0
+
+    def get_profile_values(self, profile_id):
+        self.reads += 1
+        return dict(self.profiles[profile_id])
+
+    def apply(self, profile_id, values):
+        pass
+
+
+@pytest.fixture
+def fake_desktop(monkeypatch, tmp_path):
+    backend = FakeBackend()
+    state = {'dconf': 1, 'looks': 1}
+
+    monkeypatch.setitem(cache._selected_backends, cache.Scope.USER, cache.RunScopeSqlite())
+    monkeypatch.setattr(terminal, 'get_backend', lambda: backend)
+    monkeypatch.setattr(terminal, 'dconf_fingerprint', lambda: state['dconf'])
+    monkeypatch.setattr(regolith, 'styles_fingerprint', lambda: state['looks'])
+    monkeypatch.setattr(
+        config, 'get',
+        lambda key, default=config.NoValue, **_kwargs: PROFILE_ID if key == terminal.PROFILE_ID_CONFIG_KEY else default)
+
+    return backend, state
+
+
+THEME = main.Theme(name='dark', sublime_theme='Dark', regolith_look='dark', terminal_profile='dark-source')
+
+
+def test_unrelated_dconf_change_keeps_plan(fake_desktop):
+    backend, state = fake_desktop
+    compiled = plan.get_plan(THEME)
+    assert backend.reads == 1
+
+    # no dconf change, no reads at all
+    assert plan.get_plan(THEME) == compiled
+    assert backend.reads == 1
+
+    # some other setting: the source profile's checked, not recompiled
+    state['dconf'] = 2
+    assert plan.get_plan(THEME) == compiled
+    assert backend.reads == 2
+    # and it's stamped as checked
+    assert plan.get_plan(THEME) == compiled
+    assert backend.reads == 2
+
+
+def test_source_profile_change_recompiles(fake_desktop):
+    backend, state = fake_desktop
+    plan.get_plan(THEME)
+
+    backend.profiles['dark-source']['background-color'] = "'#111111'"
+    state['dconf'] = 2
+
+    assert dict(plan.get_plan(THEME).terminal_values) == {'background-color': "'#111111'"}
+
+
+def test_looks_change_recompiles(fake_desktop):
+    backend, state = fake_desktop
+    plan.get_plan(THEME)
+
+    state['looks'] = 2
+    plan.get_plan(THEME)
+    assert backend.reads == 2
+
+
+def _replay_writing_dconf(state, monkeypatch, fail=False):
+    def activate_backends(name, backends, force=False):
+        state['dconf'] += 1
+        if fail:
+            raise main.ActivationError(name, {})
+        return {}
+
+    monkeypatch.setattr(main, 'activate_backends', activate_backends)
+
+
+def test_replay_restamps_after_own_write(fake_desktop, monkeypatch):
+    backend, state = fake_desktop
+    compiled = plan.get_plan(THEME)
+    _replay_writing_dconf(state, monkeypatch)
+
+    plan.replay(compiled)
+
+    plan.get_plan(THEME)
+    assert backend.reads == 1
+
+
+def test_failed_replay_leaves_stamps(fake_desktop, monkeypatch):
+    backend, state = fake_desktop
+    compiled = plan.get_plan(THEME)
+    _replay_writing_dconf(state, monkeypatch, fail=True)
+
+    with pytest.raises(main.ActivationError):
+        plan.replay(compiled)
+
+    plan.get_plan(THEME)
+    assert backend.reads == 2
@@ -0,0 +1,40 @@
+import json
+import threading
+
+from theme_switcher import trace
+
+
+def test_disabled_records_nothing():
+    with trace.span('ignored', key='value') as span:
+        assert span is None
+
+    assert trace.current() is None
+    assert trace.disable() == []
+
+
+def test_nesting_across_threads():
+    trace.enable()
+    try:
+        with trace.span('outer') as outer:
+            parent = trace.current()
+
+            def work():
+                with trace.span('inner', parent=parent):
+                    pass
+
+            thread = threading.Thread(target=work, name='worker')
+            thread.start()
+            thread.join()
+    finally:
+        spans = trace.disable()
+
+    assert [span.name for span in spans] == ['outer', 'inner']
+    assert spans[1].parent is outer
+    assert spans[1].thread == 'worker'
+
+    tree = trace.format_tree(spans).splitlines()
+    assert tree[0].endswith('outer')
+    assert tree[1].endswith('inner [worker]')
+
+    events = json.loads(trace.format_chrome(spans))['traceEvents']
+    assert [event['name'] for event in events if event['ph'] == 'X'] == ['outer', 'inner']